@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_WORKERS,
+    thread_name_prefix='async-read',
+)
+
+
+def detach(response):
+    """Отрисованный ответ без отложенного render().
+
+    Иначе обработчик ASGI ещё раз вызовет render() в общем
+    потоке синхронного кода.
+    """
+    if not hasattr(response, 'render'):
+        return response
+    response.render()
+    detached = HttpResponse(
+        response.content,
+        status=response.status_code,
+        headers=dict(response.items()),
+    )
+    detached.cookies = response.cookies
+    return detached
+
+
+def run_read(view, request, *args, **kwargs):
+    # Потоки пула держат свои соединения с базой, поэтому устаревшие
+    # и сломанные закрываются здесь, а не по сигналам запроса.
+    close_old_connections()
+    try:
+        return detach(view(request, *args, **kwargs))
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Асинхронная версия представления DRF для чтения.
+
+    Чтения выполняются в пуле из ``ASYNC_READ_WORKERS`` потоков, а не
+    в единственном потоке, куда Django под ASGI отправляет синхронные
+    представления, так что одновременные запросы не ждут друг друга.
+    Аутентификация, права и ответы те же, что у исходного
+    представления; остальные методы выполняются как обычно.
+    Потоковые ответы не подходят: ASGIHandler Django 3.2 читает их
+    в цикле событий, вне пула (выгрузка корзины под ASGI отдаёт
+    обычный ответ).
+    """
+    read = sync_to_async(
+        partial(run_read, view), thread_sensitive=False, executor=executor)
+    write = sync_to_async(view, thread_sensitive=True)
+
+    async def wrapper(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    for attribute in ('cls', 'actions', 'initkwargs', 'csrf_exempt'):
+        if hasattr(view, attribute):
+            setattr(wrapper, attribute, getattr(view, attribute))
+    return wrapper
+
+
+def async_read_urls(patterns, names):
+    """Заменяет представления маршрутов ``names`` асинхронными."""
+    return [
+        URLPattern(pattern.pattern, async_read_view(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
@@ -0,0 +1,87 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from recipes.versions import add_version, bump_version, find_version
+
+
+def get_token_version_name(key):
+    return f'token:{hashlib.sha256(key.encode()).hexdigest()[:32]}'
+
+
+def bump_token_versions(*keys):
+    bump_version(*map(get_token_version_name, keys),
+                 timeout=settings.AUTH_TOKEN_CACHE_TTL)
+
+
+class TokenCache:
+    """LRU-кэш токенов в памяти процесса с ограниченным временем жизни."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            token, version, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return token, version
+
+    def set(self, key, token, version):
+        with self.lock:
+            self.entries[key] = (token, version, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                         settings.AUTH_TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который не ходит в базу на каждый запрос.
+
+    Найденный токен хранится в ``token_cache`` вместе с версией
+    ``token:<хеш ключа>``. Версию меняют выход, смена пароля и любое
+    изменение пользователя (см. ``users.signals``), поэтому запись
+    становится недействительной во всех процессах сразу, а не по TTL.
+
+    Версия создаётся только для найденного в базе токена и живёт
+    не меньше записи в ``token_cache``, так что произвольные ключи
+    не оставляют следов в общем кэше.
+    """
+
+    def authenticate_credentials(self, key):
+        name = get_token_version_name(key)
+        version = find_version(name)
+        cached = token_cache.get(key)
+        if (version is not None and cached is not None
+                and cached[1] == version):
+            token = cached[0]
+        else:
+            token = super().authenticate_credentials(key)[1]
+            if version is None:
+                version = add_version(name, settings.AUTH_TOKEN_CACHE_TTL)
+            if version is not None:
+                token_cache.set(key, token, version)
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
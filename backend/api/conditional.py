@@ -0,0 +1,53 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+
+from recipes.models import Recipe
+from recipes.versions import get_versions
+
+
+def get_tags_versions(request, *args, **kwargs):
+    return get_versions('tags')
+
+
+def get_recipe_versions(request, pk, *args, **kwargs):
+    if not hasattr(request, 'recipe_versions'):
+        author_id = str(pk).isdigit() and Recipe.objects.filter(
+            pk=pk).values_list('author_id', flat=True).first()
+        request.recipe_versions = author_id and get_versions(
+            f'recipe:{pk}', f'user:{author_id}', 'tags', 'ingredients')
+    return request.recipe_versions
+
+
+def conditional_view(get_versions_for_request, per_user=False):
+    """Отвечает 304 по ETag/Last-Modified, собранным из версий данных.
+
+    Для ответов с флагами текущего пользователя (``per_user``) ETag
+    учитывает пользователя, а ответ помечается ``Vary: Authorization``.
+    """
+
+    def etag(request, *args, **kwargs):
+        versions = get_versions_for_request(request, *args, **kwargs)
+        if not versions:
+            return None
+        if per_user:
+            versions = [request.user.id, *versions]
+        key = repr(versions).encode()
+        return '"{}"'.format(hashlib.md5(key).hexdigest())
+
+    def last_modified(request, *args, **kwargs):
+        versions = get_versions_for_request(request, *args, **kwargs)
+        if not versions:
+            return None
+        return datetime.fromtimestamp(max(versions), tz=timezone.utc)
+
+    def decorator(view):
+        view = method_decorator(condition(etag, last_modified))(view)
+        if per_user:
+            view = method_decorator(vary_on_headers('Authorization'))(view)
+        return view
+
+    return decorator
@@ -0,0 +1,154 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import Field
+from rest_framework.relations import (
+    MANY_RELATION_KWARGS,
+    ManyRelatedField,
+    PrimaryKeyRelatedField,
+)
+
+BASE64_CHUNK_SIZE = 256 * 1024
+
+
+class RecipeImageField(Base64ImageField):
+    """Base64-изображение, декодируемое частями во временный файл.
+
+    Размер проверяется до и во время декодирования, а формат определяется
+    по заголовку файла без чтения всего изображения.
+    """
+
+    def validate_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_BYTES:
+            raise ValidationError(
+                'Размер изображения не должен превышать '
+                f'{settings.RECIPE_IMAGE_MAX_BYTES // (1024 * 1024)} МБ.')
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        content_type = None
+        offset = 0
+        header_end = base64_data.find(';base64,', 0, 100)
+        if header_end != -1:
+            offset = header_end + len(';base64,')
+            if self.trust_provided_content_type:
+                content_type = base64_data[:header_end].replace('data:', '')
+        if any(char in base64_data for char in ' \t\r\n'):
+            base64_data = ''.join(base64_data[offset:].split())
+            offset = 0
+        self.validate_size((len(base64_data) - offset) * 3 // 4)
+        image_file = TemporaryUploadedFile(
+            'upload', content_type, 0, None)
+        try:
+            self.decode_to(image_file, base64_data, offset)
+            extension = self.read_extension(image_file)
+        except Exception:
+            image_file.close()
+            raise
+        image_file.name = f'{uuid.uuid4()}.{extension}'
+        return image_file
+
+    def decode_to(self, image_file, base64_data, offset):
+        size = 0
+        for start in range(offset, len(base64_data), BASE64_CHUNK_SIZE):
+            try:
+                chunk = base64.b64decode(
+                    base64_data[start:start + BASE64_CHUNK_SIZE],
+                    validate=True)
+            except (binascii.Error, ValueError):
+                raise ValidationError(self.INVALID_FILE_MESSAGE)
+            size += len(chunk)
+            self.validate_size(size)
+            image_file.write(chunk)
+        image_file.size = size
+        image_file.seek(0)
+
+    def read_extension(self, image_file):
+        try:
+            with Image.open(image_file) as image:
+                extension = image.format.lower()
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            image_file.seek(0)
+        extension = 'jpg' if extension == 'jpeg' else extension
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        return extension
+
+
+class ImageVariantsField(Field):
+    """Ссылки на уменьшенные копии изображения рецепта.
+
+    Пока копии не готовы, отдаётся ссылка на исходное изображение.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        variants = {}
+        for variant in (*settings.RECIPE_IMAGE_VARIANTS, 'webp'):
+            image = getattr(recipe, f'image_{variant}') or recipe.image
+            url = image.url if image else None
+            if url and request is not None:
+                url = request.build_absolute_uri(url)
+            variants[variant] = url
+        return variants
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """Первичный ключ, объекты для которого ищутся одним запросом.
+
+    Сам по себе ``to_internal_value`` только приводит тип ключа,
+    а объекты находит ``resolve`` сразу для всего списка.
+    """
+
+    default_error_messages = {
+        'does_not_exist': 'Не найдены объекты с id: {pk_value}.',
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, pks):
+        objects = self.get_queryset().in_bulk(set(pks))
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+        if missing:
+            self.fail('does_not_exist',
+                      pk_value=', '.join(map(str, missing)))
+        return objects
+
+
+class BulkManyRelatedField(ManyRelatedField):
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.child_relation.resolve(pks)
+        return [objects[pk] for pk in pks]
@@ -2,15 +2,25 @@ from django.contrib.auth import get_user_model
 from django_filters.rest_framework import (
     FilterSet,
     BooleanFilter,
-    AllValuesMultipleFilter
+    AllValuesMultipleFilter,
+    CharFilter,
+    ChoiceFilter,
 )
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe
+from recipes.search import search_recipes
 
 
 User = get_user_model()
 
+# Фильтры, результат которых зависит от текущего пользователя.
+USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+RECIPE_ORDERINGS = {
+    'recent': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+}
+
 
 class RecipeFilter(FilterSet):
 
@@ -18,13 +28,20 @@ class RecipeFilter(FilterSet):
                                    label='tags')
     is_favorited = BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='get_is_in_shopping_cart')
+    search = CharFilter(method='get_search')
+    ordering = ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('author',
                   'tags',
                   'is_favorited',
-                  'is_in_shopping_cart',)
+                  'is_in_shopping_cart',
+                  'search',
+                  'ordering',)
 
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -36,6 +53,12 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
 
 class IngredientFilter(SearchFilter):
     search_param = 'name'
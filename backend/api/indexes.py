@@ -0,0 +1,56 @@
+import threading
+from bisect import bisect_left
+
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+from recipes.versions import get_version
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Перестраивается при первом обращении после изменения ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = (None, [], [], [])
+
+    def _build(self, version):
+        items = [dict(item) for item in IngredientSerializer(
+            Ingredient.objects.all(), many=True).data]
+        entries = sorted(
+            (item['name'].lower(), position)
+            for position, item in enumerate(items)
+        )
+        self._state = (
+            version,
+            [key for key, _ in entries],
+            [position for _, position in entries],
+            items,
+        )
+
+    def _get_state(self):
+        version = get_version('ingredients')
+        if self._state[0] != version:
+            with self._lock:
+                if self._state[0] != version:
+                    self._build(version)
+        return self._state
+
+    def search(self, terms):
+        _, keys, positions, items = self._get_state()
+        if not terms:
+            return items
+        prefix, *rest = [term.lower() for term in terms]
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\U0010ffff', lo=start)
+        found = sorted(
+            position
+            for key, position in zip(keys[start:end], positions[start:end])
+            if all(key.startswith(term) for term in rest)
+        )
+        return [items[position] for position in found]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Время и запросы к базе одного HTTP-запроса."""
+
+    def __init__(self):
+        self.view = None
+        self.total = 0.0
+        self.queries = 0
+        self.sql = 0.0
+        self.serializer = 0.0
+        self.serializing = False
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self):
+        return ', '.join((
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer * 1000:.1f}',
+        ))
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.execute(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def track_connection(connection, **kwargs):
+    # Обёртка ставится на каждое соединение один раз: так учитываются
+    # запросы из любых потоков, включая пул асинхронных представлений.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializer_timer():
+    """Учитывает время сериализации в метриках запроса.
+
+    Вложенные вызовы не считаются повторно.
+    """
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer += time.perf_counter() - started
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.values = defaultdict(
+            lambda: [[0] * len(buckets), 0, 0.0])
+
+    def observe(self, view, value):
+        values = self.values[view]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                values[0][index] += 1
+        values[1] += 1
+        values[2] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for view, (counts, count, total) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield (f'{self.name}_bucket{{view="{view}",le="{bound}"}} '
+                       f'{bucket_count}')
+            yield f'{self.name}_bucket{{view="{view}",le="+Inf"}} {count}'
+            yield f'{self.name}_count{{view="{view}"}} {count}'
+            yield f'{self.name}_sum{{view="{view}"}} {total}'
+
+
+class Registry:
+    """Гистограммы по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.duration = Histogram(
+            'foodgram_request_duration_seconds',
+            'Время обработки запроса.', DURATION_BUCKETS)
+        self.queries = Histogram(
+            'foodgram_request_db_queries',
+            'Число SQL-запросов за запрос.', QUERY_BUCKETS)
+        self.sql = Histogram(
+            'foodgram_request_db_duration_seconds',
+            'Время SQL-запросов за запрос.', DURATION_BUCKETS)
+        self.serializer = Histogram(
+            'foodgram_request_serializer_duration_seconds',
+            'Время сериализации ответа.', DURATION_BUCKETS)
+
+    def observe(self, metrics, status_code):
+        view = metrics.view or 'unresolved'
+        with self.lock:
+            self.requests[(view, status_code)] += 1
+            self.duration.observe(view, metrics.total)
+            self.queries.observe(view, metrics.queries)
+            self.sql.observe(view, metrics.sql)
+            self.serializer.observe(view, metrics.serializer)
+
+    def expose(self):
+        with self.lock:
+            lines = [
+                '# HELP foodgram_requests_total Число запросов.',
+                '# TYPE foodgram_requests_total counter',
+            ]
+            lines.extend(
+                f'foodgram_requests_total{{view="{view}",'
+                f'status="{status_code}"}} {count}'
+                for (view, status_code), count
+                in sorted(self.requests.items()))
+            for histogram in (self.duration, self.queries, self.sql,
+                              self.serializer):
+                lines.extend(histogram.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    return HttpResponse(registry.expose(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from api.metrics import RequestMetrics, current_metrics, registry
+
+
+def get_view_name(request, view_func):
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{view_func.cls.__name__}.{action}'
+    view_class = getattr(view_func, 'cls', None) or getattr(
+        view_func, 'view_class', None)
+    if view_class is not None:
+        return view_class.__name__
+    return f'{view_func.__module__}.{view_func.__name__}'
+
+
+class RequestMetricsMiddleware:
+    """Собирает время, SQL-запросы и время сериализации запроса.
+
+    Итоги отдаются в заголовке Server-Timing и копятся в гистограммах
+    ``api.metrics.registry``. Для потоковых ответов учитывается время
+    до отдачи заголовков. Работает и под WSGI, и под ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.total = time.perf_counter() - started
+            current_metrics.reset(token)
+        return self.finish(metrics, response)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.total = time.perf_counter() - started
+            current_metrics.reset(token)
+        return self.finish(metrics, response)
+
+    def finish(self, metrics, response):
+        response['Server-Timing'] = metrics.server_timing()
+        registry.observe(metrics, response.status_code)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view = get_view_name(request, view_func)
@@ -1,7 +1,212 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.versions import get_versions
+
+
+class CountPaginator(Paginator):
+
+    def __init__(self, object_list, per_page, get_count):
+        super().__init__(object_list, per_page)
+        self.get_count = get_count
+
+    @cached_property
+    def count(self):
+        return self.get_count(self.object_list)
 
 
 class LimitPagePagination(PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом keyset.
+
+    Режим keyset включается параметром ``cursor`` (пустым для первой
+    страницы) у представлений с атрибутом ``keyset_ordering``.
+
+    Количество объектов кэшируется по тексту запроса и версиям
+    ``count_versions`` представления (по умолчанию общая ``counts``)
+    на ``PAGINATION_COUNT_CACHE_TTL`` секунд, а для запросов без
+    фильтров на PostgreSQL берётся оценка планировщика, если она
+    больше ``PAGINATION_ESTIMATE_THRESHOLD``.
+    """
+
     page_size_query_param = 'limit'
     page_size = settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountPaginator(object_list, per_page, self.get_count)
+
+    def get_count(self, queryset):
+        self.count_approximate = False
+        query = queryset.order_by().values('pk').query
+        sql, params = query.sql_with_params()
+        key = 'count:{}'.format(hashlib.sha1(repr((
+            get_versions(*self.count_versions), sql, params,
+        )).encode()).hexdigest())
+        cached = cache.get(key)
+        if cached is not None:
+            count, self.count_approximate = cached
+            return count
+        count = None if query.where else estimate_count(
+            queryset.db, sql, params)
+        self.count_approximate = count is not None
+        if count is None:
+            count = queryset.count()
+        cache.set(key, (count, self.count_approximate),
+                  settings.PAGINATION_COUNT_CACHE_TTL)
+        return count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_approximate = False
+        self.keyset_ordering = getattr(view, 'keyset_ordering', None)
+        self.count_versions = getattr(view, 'count_versions', ('counts',))
+        self.use_keyset = bool(
+            self.keyset_ordering
+            and self.cursor_query_param in request.query_params)
+        if not self.use_keyset:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def paginate_keyset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset)
+        reverse, values = cursor if cursor else (False, None)
+        ordering = self.keyset_ordering
+        if reverse:
+            ordering = [invert_ordering(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+        if reverse:
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        self.next_values = (
+            self.get_values(results[-1]) if results and has_next else None)
+        self.previous_values = (
+            self.get_values(results[0]) if results and has_previous
+            else None)
+        return results
+
+    def get_values(self, obj):
+        if isinstance(obj, dict):
+            return [obj[field.lstrip('-')] for field in self.keyset_ordering]
+        return [
+            getattr(obj, field.lstrip('-')) for field in self.keyset_ordering
+        ]
+
+    def decode_cursor(self, request, queryset):
+        """Направление и значения курсора, приведённые к типам полей.
+
+        Любой испорченный курсор даёт 404, а не ошибку запроса.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, values = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if (not isinstance(values, list)
+                    or len(values) != len(self.keyset_ordering)):
+                raise ValueError('Неверное число значений курсора.')
+            values = [
+                cursor_value(queryset, field.lstrip('-'), value)
+                for field, value in zip(self.keyset_ordering, values)
+            ]
+        except (binascii.Error, UnicodeError, ValueError, TypeError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), values
+
+    def encode_cursor(self, reverse, values):
+        encoded = base64.urlsafe_b64encode(json.dumps(
+            [reverse, [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values
+            ]]).encode('ascii')).decode('ascii')
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            response = super().get_paginated_response(data)
+            if self.count_approximate:
+                response.data = OrderedDict([
+                    ('count', response.data['count']),
+                    ('count_approximate', True),
+                    *list(response.data.items())[1:],
+                ])
+            return response
+        return Response(OrderedDict([
+            ('next', self.next_values and self.encode_cursor(
+                False, self.next_values)),
+            ('previous', self.previous_values and self.encode_cursor(
+                True, self.previous_values)),
+            ('results', data),
+        ]))
+
+
+def cursor_value(queryset, name, value):
+    if not isinstance(value, (str, int, float)):
+        raise TypeError('Значение курсора должно быть строкой или числом.')
+    annotation = queryset.query.annotations.get(name)
+    field = (annotation.output_field if annotation is not None
+             else queryset.model._meta.get_field(name))
+    return field.to_python(value)
+
+
+def invert_ordering(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def keyset_filter(ordering, values):
+    conditions = []
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition = {
+            previous.lstrip('-'): value
+            for previous, value in zip(ordering[:position], values)
+        }
+        condition[f'{name}__{lookup}'] = values[position]
+        conditions.append(Q(**condition))
+    return reduce(or_, conditions)
+
+
+def estimate_count(using, sql, params):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = plan[0]['Plan']['Plan Rows']
+    if estimate > settings.PAGINATION_ESTIMATE_THRESHOLD:
+        return estimate
+    return None
@@ -0,0 +1,24 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+class LimitedJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        if request is not None:
+            try:
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > settings.RECIPE_MAX_REQUEST_BYTES:
+                raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
@@ -1,16 +1,29 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import (
     IntegerField,
+    ListSerializer,
     ModelSerializer,
-    PrimaryKeyRelatedField,
     ReadOnlyField,
     SerializerMethodField,
 )
 
+from api.fields import (
+    BulkPrimaryKeyRelatedField,
+    ImageVariantsField,
+    RecipeImageField,
+)
+from api.metrics import TimedSerializerMixin
+from api.viewer import ViewerStateListSerializer, ViewerStateMixin
+from recipes.images import (
+    delete_images,
+    get_image_names,
+    schedule_recipe_image,
+)
 from recipes.models import (
     Ingredient,
     IngredientsAmount,
@@ -25,15 +38,17 @@ from users.models import Follow
 User = get_user_model()
 
 
-class IsSubscribedMixin:
+class IsSubscribedMixin(ViewerStateMixin):
+    viewer_relations = (('following', 'id', 'is_subscribed'),)
+
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = obj
-        return (request and request.user.is_authenticated
-                and user.follower.filter(user=request.user).exists())
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return self.viewer_has('following', obj.id)
 
 
-class UsersSerializer(UserSerializer, IsSubscribedMixin):
+class UsersSerializer(TimedSerializerMixin, UserSerializer,
+                      IsSubscribedMixin):
 
     is_subscribed = SerializerMethodField()
 
@@ -47,20 +62,25 @@ class UsersSerializer(UserSerializer, IsSubscribedMixin):
             'last_name',
             'is_subscribed',
         )
+        list_serializer_class = ViewerStateListSerializer
+
 
+class RecipeSerializerShortInfo(TimedSerializerMixin, ModelSerializer):
+    image_variants = ImageVariantsField()
 
-class RecipeSerializerShortInfo(ModelSerializer):
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
 
 
-class FollowSerializer(IsSubscribedMixin, ModelSerializer,):
+class FollowSerializer(TimedSerializerMixin, IsSubscribedMixin,
+                       ModelSerializer,):
 
     is_subscribed = SerializerMethodField()
     recipes = SerializerMethodField()
@@ -78,6 +98,7 @@ class FollowSerializer(IsSubscribedMixin, ModelSerializer,):
             'is_subscribed',
             'recipes_count',
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_recipes(self, obj):
         request = self.context.get('request')
@@ -88,17 +109,19 @@ class FollowSerializer(IsSubscribedMixin, ModelSerializer,):
         return RecipeSerializerShortInfo(recipes, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
 
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
 
     class Meta:
         model = Ingredient
@@ -121,8 +144,14 @@ class ShowIngredientsInRecipeSerializer(ModelSerializer):
         )
 
 
-class RecipeReadSerializer(ModelSerializer):
+class RecipeReadSerializer(TimedSerializerMixin, ViewerStateMixin,
+                           ModelSerializer):
     """comment123456"""
+    viewer_relations = (
+        ('favorites', 'id', 'is_favorited'),
+        ('shopping_cart', 'id', 'is_in_shopping_cart'),
+        ('following', 'author_id', 'author.is_subscribed'),
+    )
     author = UsersSerializer(read_only=True)
     ingredients = ShowIngredientsInRecipeSerializer(
         many=True,
@@ -131,6 +160,7 @@ class RecipeReadSerializer(ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -142,41 +172,53 @@ class RecipeReadSerializer(ModelSerializer):
             'is_favorited',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
             'is_in_shopping_cart',
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and obj.favorite.filter(user=request.user).exists())
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return self.viewer_has('favorites', obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and obj.shopping_cart.filter(user=request.user).exists())
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return self.viewer_has('shopping_cart', obj.id)
+
+
+class IngredientCreateListSerializer(ListSerializer):
+
+    def to_internal_value(self, data):
+        ingredients = super().to_internal_value(data)
+        objects = self.child.fields['id'].resolve(
+            [ingredient['id'] for ingredient in ingredients])
+        for ingredient in ingredients:
+            ingredient['id'] = objects[ingredient['id']]
+        return ingredients
 
 
 class IngredientCreateSerializer(ModelSerializer):
 
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = IntegerField(min_value=1, max_value=32767)
 
     class Meta:
         model = IngredientsAmount
         fields = ('id',
                   'amount',)
+        list_serializer_class = IngredientCreateListSerializer
 
 
 class RecipeCreateSerializer(ModelSerializer):
 
     author = UserSerializer(read_only=True)
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
     ingredients = IngredientCreateSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     cooking_time = IntegerField(min_value=1, max_value=32767)
 
     class Meta:
@@ -192,6 +234,14 @@ class RecipeCreateSerializer(ModelSerializer):
             'cooking_time',
         )
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def validate(self, data):
         tags = data.get('tags')
         ingredients = data.get('ingredients')
@@ -214,6 +264,7 @@ class RecipeCreateSerializer(ModelSerializer):
             ingredient_ids.add(ingredient_id)
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -221,6 +272,7 @@ class RecipeCreateSerializer(ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self.create_recipe_ingredients(recipe=recipe, ingredients=ingredients)
         recipe.tags.set(tags)
+        schedule_recipe_image(recipe.id)
         return recipe
 
     def create_recipe_ingredients(self, recipe, ingredients):
@@ -235,16 +287,61 @@ class RecipeCreateSerializer(ModelSerializer):
             )
         IngredientsAmount.objects.bulk_create(ingredients_to_create)
 
+    def update_recipe_ingredients(self, recipe, ingredients):
+        """Применяет к ингредиентам рецепта только изменения.
+
+        Итоги корзин пересчитывают сигналы и менеджер IngredientsAmount.
+        """
+        current = {
+            amount.ingredient_id: amount
+            for amount in recipe.ingredient_amount.all()
+        }
+        to_create = []
+        to_update = []
+        for ingredient in ingredients:
+            ingredient_id = ingredient['id'].id
+            amount = current.pop(ingredient_id, None)
+            if amount is None:
+                to_create.append(IngredientsAmount(
+                    ingredient_id=ingredient_id,
+                    recipe=recipe,
+                    amount=ingredient['amount'],
+                ))
+            elif amount.amount != ingredient['amount']:
+                amount.amount = ingredient['amount']
+                to_update.append(amount)
+        if current:
+            IngredientsAmount.objects.filter(
+                id__in=[amount.id for amount in current.values()]
+            ).delete()
+        if to_update:
+            IngredientsAmount.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientsAmount.objects.bulk_create(to_create)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_recipe_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        self.update_recipe_ingredients(instance, ingredients)
+        if 'image' not in validated_data:
+            return super().update(instance, validated_data)
+        old_images = get_image_names(instance)
+        validated_data.update(image_list='', image_detail='', image_webp='')
+        schedule_recipe_image(instance.id)
+        instance = super().update(instance, validated_data)
+        delete_images(old_images - get_image_names(instance))
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch('ingredient_amount',
+                     queryset=IngredientsAmount.objects.select_related(
+                         'ingredient').order_by('id')),
+        )
         return RecipeReadSerializer(instance, context=self.context).data
 
 
@@ -302,7 +399,7 @@ class ShoppingListSerializer(ModelSerializer):
         return data
 
 
-class FollowingSerializer(ModelSerializer):
+class FollowingSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = Follow
         fields = ('user', 'author')
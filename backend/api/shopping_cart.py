@@ -0,0 +1,69 @@
+import csv
+import io
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+PDF_FONT_NAME = 'ShoppingCart'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def text_chunks(rows):
+    for row in rows:
+        yield (
+            f'Ингр.: {row["ingredient__name"]}\n'
+            f'Кол.: {row["total_amount"]} '
+            f'{row["ingredient__measurement_unit"]}\n\n'
+        )
+
+
+def csv_chunks(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['total_amount'],
+            row['ingredient__measurement_unit'],
+        ))
+
+
+def pdf_chunks(rows):
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT))
+    buffer = io.BytesIO()
+    canvas = Canvas(buffer, pagesize=A4)
+    _, page_height = A4
+    canvas.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+    y = page_height - PDF_MARGIN
+    for row in rows:
+        if y < PDF_MARGIN:
+            canvas.showPage()
+            canvas.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+            y = page_height - PDF_MARGIN
+        canvas.drawString(
+            PDF_MARGIN, y,
+            f'{row["ingredient__name"]} — {row["total_amount"]} '
+            f'{row["ingredient__measurement_unit"]}',
+        )
+        y -= PDF_LINE_HEIGHT
+    canvas.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ('text/plain', text_chunks),
+    'csv': ('text/csv', csv_chunks),
+    'pdf': ('application/pdf', pdf_chunks),
+}
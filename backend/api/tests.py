@@ -0,0 +1,605 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.authentication import get_token_version_name, token_cache
+from api.fast_serializers import recipe_rows, serialize_recipe_rows
+from api.serializers import RecipeCreateSerializer, RecipeReadSerializer
+from api.views import recipes_with_relations
+from recipes.feed import materialize_timeline
+from recipes.images import get_image_names
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientsAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from recipes.versions import find_version
+from users.models import Follow, User
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api_tests',
+    },
+}
+RECIPES_COUNT = 25
+# Для холодного кэша: варианты фильтра тегов, количество, строки
+# страницы и четыре запроса фрагментов (рецепты, авторы, теги,
+# ингредиенты); для пользователя ещё токен и подписки.
+RECIPE_LIST_QUERIES = {
+    'anonymous': 7,
+    'authenticated': 9,
+}
+
+
+def encode_image(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}',
+                               color=f'#00000{number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(40)
+        ]
+        cls.authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(3)
+        ]
+        cls.viewer = User.objects.create(
+            username='viewer', email='viewer@example.com',
+            first_name='Имя', last_name='Фамилия')
+        cls.token = Token.objects.create(user=cls.viewer)
+        cls.recipes = [
+            cls.create_recipe(cls.authors[number % len(cls.authors)],
+                              number)
+            for number in range(RECIPES_COUNT)
+        ]
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.viewer, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.viewer, recipe=recipe)
+        Follow.objects.create(user=cls.viewer, author=cls.authors[0])
+
+    @classmethod
+    def create_recipe(cls, author, number, ingredients=3):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Текст рецепта',
+            cooking_time=10, image='food/recipe/test.jpg')
+        recipe.tags.set(cls.tags[:1 + number % len(cls.tags)])
+        IngredientsAmount.objects.bulk_create(
+            IngredientsAmount(recipe=recipe, ingredient=ingredient,
+                              amount=number + 1)
+            for ingredient in cls.ingredients[:ingredients])
+        return recipe
+
+    def setUp(self):
+        self.clear_caches()
+
+    def clear_caches(self):
+        cache.clear()
+        token_cache.clear()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeListQueriesTest(RecipeTestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def assert_list_queries(self, viewer):
+        for limit in (6, 20):
+            with self.subTest(viewer=viewer, limit=limit):
+                self.clear_caches()
+                with self.assertNumQueries(RECIPE_LIST_QUERIES[viewer]):
+                    response = self.client.get(
+                        f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries('anonymous')
+
+    def test_authenticated(self):
+        self.authenticate()
+        self.assert_list_queries('authenticated')
+
+
+class RecipeFeedTest(RecipeTestCase):
+    """Лента листается курсором одинаково с лентой в таблице и без неё."""
+
+    def get_feed_ids(self):
+        ids = []
+        url = '/api/recipes/feed/?limit=2&cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_cursor(self):
+        self.authenticate()
+        expected = list(Recipe.objects.filter(
+            author=self.authors[0]).order_by(
+                '-pub_date', '-id').values_list('id', flat=True))
+        self.assertEqual(self.get_feed_ids(), expected)
+        materialize_timeline(self.viewer.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_feed_ids(), expected)
+        self.assertTrue(any(
+            '"recipes_timelineentry"."pub_date" AS "feed_pub_date"'
+            in query['sql'] and 'ORDER BY "feed_pub_date" DESC' in query['sql']
+            for query in queries))
+
+
+class RecipeSearchTest(RecipeTestCase):
+    """Поиск рецептов по названию и тексту через полнотекстовый индекс."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.borscht = cls.create_search_recipe('Борщ', 'Свёкла и капуста')
+        cls.salad = cls.create_search_recipe('Салат', 'Борщевой набор')
+        cls.pie = cls.create_search_recipe('Капустный пирог', 'Тесто')
+
+    @classmethod
+    def create_search_recipe(cls, name, text):
+        return Recipe.objects.create(
+            author=cls.authors[0], name=name, text=text, cooking_time=10,
+            image='food/recipe/test.jpg')
+
+    def search(self, query):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, 'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_ranked_above_text(self):
+        self.assertEqual(self.search('борщ'),
+                         [self.borscht.id, self.salad.id])
+        self.assertEqual(self.search('капуст'),
+                         [self.pie.id, self.borscht.id])
+
+    def test_all_words_by_prefix(self):
+        self.assertEqual(self.search('кап пир'), [self.pie.id])
+        self.assertEqual(self.search('борщевой салат'), [self.salad.id])
+        self.assertEqual(self.search('пирожок'), [])
+
+    def test_empty_query(self):
+        everything = Recipe.objects.count()
+        for query in ('', '  ', '!?.,'):
+            with self.subTest(query=query):
+                self.assertEqual(len(self.search(query)), everything)
+
+    def test_pages(self):
+        expected = self.search('рецепт')
+        self.assertEqual(len(expected), RECIPES_COUNT)
+        ids = []
+        for page in range(1, 4):
+            response = self.client.get('/api/recipes/', {
+                'search': 'рецепт', 'limit': 10, 'page': page})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], RECIPES_COUNT)
+            ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(ids, expected)
+
+    def test_cursor(self):
+        ids = []
+        url = '/api/recipes/?' + urlencode(
+            {'search': 'рецепт', 'limit': 10, 'cursor': ''})
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(ids), RECIPES_COUNT)
+        self.assertEqual(set(ids), {recipe.id for recipe in self.recipes})
+
+    def test_index_follows_changes(self):
+        self.pie.name = 'Ватрушка'
+        self.pie.save()
+        self.assertEqual(self.search('пирог'), [])
+        self.assertEqual(self.search('ватруш'), [self.pie.id])
+        self.borscht.delete()
+        self.assertEqual(self.search('борщ'), [self.salad.id])
+
+
+class CursorTest(RecipeTestCase):
+    """Испорченный курсор даёт 404, а не ошибку сервера."""
+
+    bad_cursors = (
+        [False, [{'a': 1}, 2]],
+        [False, ['2024-01-01T00:00:00+00:00', 'x']],
+        [False, ['2024-01-01T00:00:00+00:00', [2]]],
+        [False, [None, 2]],
+        [False, [1]],
+        [False, 5],
+        5,
+    )
+    paths = ('/api/recipes/', '/api/recipes/feed/',
+             '/api/recipes/?ordering=popular', '/api/users/')
+
+    def encode(self, cursor):
+        return base64.urlsafe_b64encode(
+            json.dumps(cursor).encode()).decode()
+
+    def assert_not_found(self, paths, cursors):
+        for path in paths:
+            for cursor in cursors:
+                with self.subTest(path=path, cursor=cursor):
+                    response = self.client.get(path, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 404)
+
+    def test_bad_cursors(self):
+        self.authenticate()
+        self.assert_not_found(self.paths, ['!!!', 'bm90IGpzb24='] + [
+            self.encode(cursor) for cursor in self.bad_cursors])
+        self.assert_not_found(self.paths[:2], [
+            self.encode([False, ['notadate', 2]])])
+
+    def test_valid_cursor(self):
+        self.authenticate()
+        for path in self.paths:
+            with self.subTest(path=path):
+                response = self.client.get(path, {'cursor': '', 'limit': 2})
+                self.assertEqual(response.status_code, 200)
+                response = self.client.get(response.data['next'])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), 2)
+
+
+class RecipeCountCacheTest(RecipeTestCase):
+    """Кэш количеств сбрасывают только изменения, влияющие на список."""
+
+    paths = ('/api/recipes/', '/api/recipes/?is_favorited=1')
+
+    def counts_in_database(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return any('COUNT(' in query['sql'] for query in queries)
+
+    def assert_counted(self, expected):
+        for path, counted in zip(self.paths, expected):
+            with self.subTest(path=path):
+                self.assertEqual(self.counts_in_database(path), counted)
+
+    def test_other_user_favorite(self):
+        self.authenticate()
+        self.assert_counted((True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.authors[1],
+                                    recipe=self.recipes[1])
+        self.assert_counted((False, False))
+
+    def test_own_favorite(self):
+        self.authenticate()
+        self.assert_counted((True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.viewer, recipe=self.recipes[1])
+        self.assert_counted((False, True))
+
+    def test_new_user(self):
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.data['count'], User.objects.count())
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(
+                username='newcomer', email='newcomer@example.com',
+                first_name='Имя', last_name='Фамилия')
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.data['count'], User.objects.count())
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.data['count'], User.objects.count())
+
+    def test_new_recipe(self):
+        self.authenticate()
+        self.assert_counted((True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(self.authors[0], RECIPES_COUNT)
+        self.assert_counted((True, True))
+
+
+class RecipeSerializerParityTest(RecipeTestCase):
+    """serialize_recipe_rows отдаёт тот же JSON, что RecipeReadSerializer."""
+
+    ordering = ('-pub_date', '-id')
+
+    def get_request(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def render_slow(self, user):
+        request = self.get_request(user)
+        recipes = recipes_with_relations(user).order_by(*self.ordering)
+        return JSONRenderer().render(RecipeReadSerializer(
+            recipes, many=True, context={'request': request}).data)
+
+    def render_fast(self, user):
+        rows = recipe_rows(Recipe.objects.order_by(*self.ordering), user)
+        return JSONRenderer().render(
+            serialize_recipe_rows(list(rows), self.get_request(user)))
+
+    def test_parity(self):
+        for user in (AnonymousUser(), self.viewer):
+            with self.subTest(user=user):
+                self.clear_caches()
+                expected = self.render_slow(user)
+                self.assertEqual(self.render_fast(user), expected)
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.render_fast(user), expected)
+                # Второй проход берёт фрагменты из кэша.
+                self.assertFalse(any(
+                    'recipes_ingredientsamount' in query['sql']
+                    for query in queries))
+
+
+class TokenCacheTest(RecipeTestCase):
+    """Версии токенов создаются только для токенов из базы."""
+
+    def get_me(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return self.client.get('/api/users/me/')
+
+    def test_unknown_key(self):
+        self.assertEqual(self.get_me('unknown').status_code, 401)
+        self.assertIsNone(find_version(get_token_version_name('unknown')))
+
+    def test_cached_token(self):
+        self.assertEqual(self.get_me(self.token.key).status_code, 200)
+        self.assertIsNotNone(
+            find_version(get_token_version_name(self.token.key)))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_me(self.token.key).status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql']
+                             for query in queries))
+
+    def test_deleted_token(self):
+        self.assertEqual(self.get_me(self.token.key).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(key=self.token.key).delete()
+        self.assertEqual(self.get_me(self.token.key).status_code, 401)
+
+
+class RecipeUpdateQueriesTest(RecipeTestCase):
+    """PATCH рецепта применяет к ингредиентам только изменения."""
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate()
+
+    def patch(self, recipe, amounts):
+        return self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'tags': [tag.id for tag in recipe.tags.all()],
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': amount}
+                    for ingredient_id, amount in amounts.items()
+                ],
+            },
+            format='json',
+        )
+
+    def get_amounts(self, recipe):
+        return dict(recipe.ingredient_amount.order_by('id').values_list(
+            'ingredient_id', 'amount'))
+
+    def amount_queries(self, queries, statement):
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith(statement)
+            and 'recipes_ingredientsamount' in query['sql']
+        ]
+
+    def patch_unchanged(self, ingredients):
+        recipe = self.create_recipe(self.viewer, ingredients,
+                                    ingredients=ingredients)
+        amounts = self.get_amounts(recipe)
+        self.clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(recipe, amounts)
+        self.assertEqual(response.status_code, 200)
+        for statement in ('INSERT', 'UPDATE', 'DELETE'):
+            self.assertEqual(self.amount_queries(queries, statement), [])
+        self.assertEqual(self.get_amounts(recipe), amounts)
+        return len(queries)
+
+    def test_unchanged_ingredients(self):
+        # Полнотекстовый индекс обновляется по-разному в PostgreSQL
+        # и SQLite, поэтому сравниваются два размера, а не константа.
+        self.assertEqual(self.patch_unchanged(3), self.patch_unchanged(30))
+
+    def test_changed_amount(self):
+        recipe = self.create_recipe(self.viewer, 30, ingredients=30)
+        ShoppingCart.objects.create(user=self.authors[0], recipe=recipe)
+        amounts = self.get_amounts(recipe)
+        ingredient_id = next(iter(amounts))
+        amounts[ingredient_id] += 5
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(recipe, amounts)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.amount_queries(queries, 'UPDATE')), 1)
+        for statement in ('INSERT', 'DELETE'):
+            self.assertEqual(self.amount_queries(queries, statement), [])
+        self.assertEqual(self.get_amounts(recipe), amounts)
+        self.assertEqual(ShoppingCartIngredient.objects.get(
+            user=self.authors[0], ingredient_id=ingredient_id).amount,
+            amounts[ingredient_id])
+
+
+class RecipeImageTest(RecipeTestCase):
+    """Замена изображения удаляет файлы прежнего и его вариантов."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(MEDIA_ROOT=media_root,
+                                 RECIPE_IMAGE_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.authenticate()
+
+    def payload(self, color):
+        return {
+            'name': 'Рецепт с фото',
+            'text': 'Текст рецепта',
+            'cooking_time': 10,
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 5}],
+            'image': encode_image(color),
+        }
+
+    def test_replace_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.payload('red'), format='json')
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        old_images = get_image_names(recipe)
+        self.assertEqual(len(old_images), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', self.payload('blue'),
+                format='json')
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        new_images = get_image_names(recipe)
+        self.assertEqual(len(new_images), 4)
+        self.assertFalse(old_images & new_images)
+        for name in old_images:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in new_images:
+            self.assertTrue(default_storage.exists(name), name)
+
+
+class RecipeRelationsTest(RecipeTestCase):
+    """Теги и ингредиенты рецепта ищутся одним запросом на поле."""
+
+    def payload(self, tag_ids, ingredient_ids):
+        return {
+            'name': 'Рецепт',
+            'text': 'Текст рецепта',
+            'cooking_time': 10,
+            'tags': tag_ids,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 5}
+                for ingredient_id in ingredient_ids
+            ],
+            'image': encode_image('green'),
+        }
+
+    def test_one_query_per_field(self):
+        tag_ids = [tag.id for tag in self.tags]
+        for ingredients in (3, 30):
+            with self.subTest(ingredients=ingredients):
+                serializer = RecipeCreateSerializer(data=self.payload(
+                    tag_ids, [ingredient.id for ingredient
+                              in self.ingredients[:ingredients]]))
+                with self.assertNumQueries(2):
+                    self.assertTrue(serializer.is_valid(),
+                                    serializer.errors)
+
+    def test_all_missing_ids(self):
+        self.authenticate()
+        response = self.client.post('/api/recipes/', self.payload(
+            [self.tags[0].id, 9999, 8888],
+            [self.ingredients[0].id, 7777, 6666, 5555],
+        ), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['tags'],
+                         ['Не найдены объекты с id: 9999, 8888.'])
+        self.assertEqual(response.data['ingredients'],
+                         ['Не найдены объекты с id: 7777, 6666, 5555.'])
+
+
+class ShoppingCartDownloadTest(RecipeTestCase):
+    """Выгрузка корзины одинакова под WSGI и ASGI."""
+
+    def setUp(self):
+        super().setUp()
+        # Как тестовый клиент: обработчик ASGI не должен закрывать
+        # соединение с базой, в транзакции которого идёт тест.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    def asgi_get(self, path, query):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(ASGIHandler())({
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query.encode(),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token.key}'.encode()),
+            ],
+        }, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        return b''.join(message.get('body', b'')
+                        for message in messages[1:])
+
+    def test_asgi(self):
+        self.authenticate()
+        path = '/api/recipes/download_shopping_cart/'
+        for file_format in ('txt', 'csv'):
+            with self.subTest(format=file_format):
+                response = self.client.get(path, {'format': file_format})
+                self.assertEqual(response.status_code, 200)
+                expected = b''.join(response.streaming_content)
+                self.assertIn('Ингредиент 0'.encode(), expected)
+                self.assertEqual(
+                    self.asgi_get(path, f'format={file_format}'), expected)
@@ -1,11 +1,21 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_read_urls
 from .views import (IngredientViewSet,
                     RecipeViewSet,
                     TagViewSet,
                     UsersViewSet)
 
+ASYNC_READ_ROUTES = {
+    'recipes-list',
+    'recipes-detail',
+    'recipes-download-shopping-cart',
+    'ingredients-list',
+    'tags-list',
+}
+
 router = DefaultRouter()
 
 router.register('users', UsersViewSet, basename='users')
@@ -13,7 +23,11 @@ router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
 
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = async_read_urls(router_urls, ASYNC_READ_ROUTES)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from operator import attrgetter
+
+from rest_framework.serializers import ListSerializer
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+RELATIONS = {
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+    'following': (Follow, 'author_id'),
+}
+
+
+class ViewerState:
+    """Избранное, корзина и подписки текущего пользователя.
+
+    Живёт один запрос. Загружает только id объектов, которые
+    сериализуются, одним запросом на связь и пачку объектов.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.checked = defaultdict(set)
+        self.found = defaultdict(set)
+
+    def load(self, relation, ids):
+        missing = set(ids) - self.checked[relation]
+        if not missing or not self.user.is_authenticated:
+            return
+        model, field = RELATIONS[relation]
+        self.found[relation].update(model.objects.filter(
+            user=self.user, **{f'{field}__in': missing},
+        ).values_list(field, flat=True))
+        self.checked[relation] |= missing
+
+    def has(self, relation, pk):
+        self.load(relation, (pk,))
+        return pk in self.found[relation]
+
+
+def get_viewer_state(request):
+    # Состояние хранится на HttpRequest, чтобы его разделяли все
+    # обёртки DRF Request одного запроса.
+    http_request = getattr(request, '_request', request)
+    state = getattr(http_request, 'viewer_state', None)
+    if state is None or state.user != request.user:
+        state = ViewerState(request.user)
+        http_request.viewer_state = state
+    return state
+
+
+def has_value(obj, path):
+    try:
+        attrgetter(path)(obj)
+    except AttributeError:
+        return False
+    return True
+
+
+class ViewerStateMixin:
+    """Флаги текущего пользователя через общий ViewerState.
+
+    ``viewer_relations`` — тройки (связь, путь к id, путь к аннотации):
+    объекты, у которых флаг уже аннотирован в queryset, не загружаются.
+    """
+
+    viewer_relations = ()
+
+    def viewer_has(self, relation, pk):
+        request = self.context.get('request')
+        if not (request and request.user.is_authenticated):
+            return False
+        return get_viewer_state(request).has(relation, pk)
+
+
+class ViewerStateListSerializer(ListSerializer):
+    """Заранее загружает флаги для всех объектов списка."""
+
+    def to_representation(self, data):
+        objects = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if objects and request and request.user.is_authenticated:
+            state = get_viewer_state(request)
+            for relation, pk, annotation in self.child.viewer_relations:
+                state.load(relation, {
+                    attrgetter(pk)(obj) for obj in objects
+                    if not has_value(obj, annotation)
+                })
+        return super().to_representation(objects)
@@ -1,12 +1,29 @@
-from django.http import HttpResponse
+from pathlib import Path
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Value,
+    Window,
+    prefetch_related_objects,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
@@ -15,9 +32,24 @@ from rest_framework.permissions import (
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.conditional import (
+    conditional_view,
+    get_recipe_versions,
+    get_tags_versions,
+)
+from api.fast_serializers import recipe_rows, serialize_recipe_rows
+from api.filters import (
+    RECIPE_ORDERINGS,
+    USER_FILTERS,
+    IngredientFilter,
+    RecipeFilter,
+)
+from api.indexes import ingredient_index
+from api.negotiation import IgnoreClientContentNegotiation
 from api.pagination import LimitPagePagination
+from api.parsers import LimitedJSONParser
 from api.permissions import IsOwnerOrReadOnly
+from api.shopping_cart import SHOPPING_CART_FORMATS
 from api.serializers import (
     FavoriteRecipeSerializer,
     FollowSerializer,
@@ -29,12 +61,15 @@ from api.serializers import (
     TagSerializer,
     UsersSerializer,
 )
+from recipes.feed import FEED_FIELDS, FEED_ORDERING, get_feed
+from recipes.versions import get_user_counts_version_name
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientsAmount,
     Recipe,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
 from users.models import Follow
@@ -42,11 +77,60 @@ from users.models import Follow
 User = get_user_model()
 
 
+def recipes_with_relations(user):
+    """Рецепты с предзагрузкой всего, что нужно RecipeReadSerializer."""
+    queryset = Recipe.objects.prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredient_amount',
+            queryset=IngredientsAmount.objects.select_related(
+                'ingredient').order_by('id'),
+        ),
+    )
+    if not user.is_authenticated:
+        return queryset.select_related('author')
+    return queryset.prefetch_related(
+        Prefetch(
+            'author',
+            queryset=User.objects.annotate(
+                is_subscribed=Exists(Follow.objects.filter(
+                    user=user, author=OuterRef('pk')))),
+        ),
+    ).annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe=OuterRef('pk'))),
+        is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+            user=user, recipe=OuterRef('pk'))),
+    )
+
+
+def newest_recipes_per_author(author_ids, limit):
+    ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('pub_date').desc(),
+        ),
+    ).order_by().values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    return Recipe.objects.filter(id__in=RawSQL(
+        f'SELECT "id" FROM ({sql}) AS "ranked" WHERE "row_number" <= %s',
+        (*params, limit),
+    ))
+
+
 class UsersViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     pagination_class = LimitPagePagination
     permission_classes = (AllowAny,)
+    keyset_ordering = ('username', 'id')
+
+    @property
+    def count_versions(self):
+        if self.action == 'subscriptions':
+            return (get_user_counts_version_name(self.request.user.id),)
+        return ('users',)
 
     def get_permissions(self):
         if self.action == 'me':
@@ -57,7 +141,16 @@ class UsersViewSet(DjoserUserViewSet):
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         pages = self.paginate_queryset(User.objects.filter(
-            following__user=request.user))
+            following__user=request.user).annotate(
+                recipes_count=Count('recipes'),
+                is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('username'))
+        recipes = Recipe.objects.all()
+        recipes_limit = request.GET.get('recipes_limit')
+        if recipes_limit:
+            recipes = newest_recipes_per_author(
+                [author.id for author in pages], int(recipes_limit))
+        prefetch_related_objects(pages, Prefetch('recipes', queryset=recipes))
         serializer = FollowSerializer(pages,
                                       many=True,
                                       context={'request': request})
@@ -97,6 +190,14 @@ class TagViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional_view(get_tags_versions)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_view(get_tags_versions)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
@@ -105,20 +206,73 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        terms = IngredientFilter().get_search_terms(request)
+        return Response(ingredient_index.search(terms))
+
 
 class RecipeViewSet(ModelViewSet):
-    queryset = Recipe.objects.all()
     permission_classes = (IsOwnerOrReadOnly,
                           IsAuthenticatedOrReadOnly)
     pagination_class = LimitPagePagination
+    parser_classes = (LimitedJSONParser, FormParser, MultiPartParser)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def keyset_ordering(self):
+        ordering = self.request.query_params.get('ordering')
+        if self.action == 'feed' and ordering not in RECIPE_ORDERINGS:
+            return FEED_ORDERING
+        return RECIPE_ORDERINGS.get(ordering, RECIPE_ORDERINGS['recent'])
+
+    @property
+    def count_versions(self):
+        user = self.request.user
+        if user.is_authenticated and (self.action == 'feed' or any(
+                self.request.query_params.get(name)
+                for name in USER_FILTERS)):
+            return ('counts', get_user_counts_version_name(user.id))
+        return ('counts',)
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.all()
+        return recipes_with_relations(self.request.user)
+
+    def list_recipes(self, queryset, fields=()):
+        rows = recipe_rows(self.filter_queryset(queryset), self.request.user,
+                           fields)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(serialize_recipe_rows(list(rows), self.request))
+        return self.get_paginated_response(
+            serialize_recipe_rows(page, self.request))
+
+    def list(self, request, *args, **kwargs):
+        return self.list_recipes(self.get_queryset())
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        return self.list_recipes(get_feed(request.user), FEED_FIELDS)
+
+    @conditional_view(get_recipe_versions, per_user=True)
+    def retrieve(self, request, *args, **kwargs):
+        recipe = get_object_or_404(
+            recipe_rows(self.filter_queryset(self.get_queryset()),
+                        request.user),
+            pk=kwargs[self.lookup_field],
+        )
+        self.check_object_permissions(request, recipe)
+        return Response(serialize_recipe_rows([recipe], request)[0])
+
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH'):
             return RecipeCreateSerializer
         return RecipeReadSerializer
 
+    @transaction.atomic
     def create_item(self, request, pk, serializer_class, success_message):
         user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -129,6 +283,7 @@ class RecipeViewSet(ModelViewSet):
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_item(self, request, pk, model_class,):
         user = request.user
         deleted_items_count, _ = model_class.objects.filter(
@@ -146,20 +301,13 @@ class RecipeViewSet(ModelViewSet):
                                     'Рецепт добавлен в избранное')
         return self.delete_item(request, pk, Favorite)
 
-    def generate_shopping_cart_data(self, user):
-        ingredients_amounts = IngredientsAmount.objects.filter(
-            recipe__shopping_cart__user=user).values(
-                'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                    total_amount=Sum('amount'))
-        data = ""
-        for ingr_amount in ingredients_amounts:
-            data += (
-                f'Ингр.: {ingr_amount["ingredient__name"]}\n'
-                f'Кол.: {ingr_amount["total_amount"]} '
-                f'{ingr_amount["ingredient__measurement_unit"]}\n\n'
-            )
-        return data
+    def get_shopping_cart_rows(self, user):
+        return ShoppingCartIngredient.objects.filter(user=user).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            total_amount=F('amount')).order_by(
+                'ingredient__name').iterator(
+                    chunk_size=settings.SHOPPING_CART_CHUNK_SIZE)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
@@ -174,12 +322,28 @@ class RecipeViewSet(ModelViewSet):
                                 ShoppingCart,)
 
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            content_negotiation_class=IgnoreClientContentNegotiation)
     def download_shopping_cart(self, request):
-        user = request.user
-        data = self.generate_shopping_cart_data(user)
-        response = HttpResponse(data,
-                                content_type='text/plain')
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                {'message': 'Неподдерживаемый формат файла'},
+                status=status.HTTP_400_BAD_REQUEST)
+        content_type, chunks = SHOPPING_CART_FORMATS[file_format]
+        rows = self.get_shopping_cart_rows(request.user)
+        if isinstance(request._request, ASGIRequest):
+            # ASGIHandler Django 3.2 читает потоковый ответ в цикле
+            # событий, где запросы к базе запрещены, поэтому под ASGI
+            # строки корзины (по одной на ингредиент) читаются здесь,
+            # в потоке представления, и отдаются обычным ответом.
+            response = HttpResponse(chunks(list(rows)),
+                                    content_type=content_type)
+        else:
+            response = StreamingHttpResponse(chunks(rows),
+                                             content_type=content_type)
+        filename = Path(settings.SHOPING_CARD_NAME).with_suffix(
+            f'.{file_format}')
         response['Content-Disposition'] = (
-            f'attachment; filename={settings.SHOPING_CARD_NAME}')
+            f'attachment; filename={filename}')
         return response
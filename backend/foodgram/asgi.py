@@ -2,6 +2,11 @@
 ASGI config for foodgram project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+With ASYNC_READ_VIEWS=True hot read-only endpoints are served by async
+views, e.g.::
+
+    ASYNC_READ_VIEWS=True gunicorn -k uvicorn.workers.UvicornWorker \
+        foodgram.asgi
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
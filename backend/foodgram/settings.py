@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +83,32 @@ DATABASES = {
     }
 }
 
+# В кэше лежат версии данных, количества и фрагменты рецептов, общие
+# для всех процессов, поэтому в продакшене нужен memcached. Файловый
+# кэш годится только для локальной разработки.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND')
+if CACHE_BACKEND:
+    CACHES = {
+        'default': {
+            'BACKEND': CACHE_BACKEND,
+            'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        }
+    }
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        'Укажите CACHE_BACKEND и CACHE_LOCATION общего кэша, например '
+        'django.core.cache.backends.memcached.PyMemcacheCache и cache:11211')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -114,12 +142,20 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', 16))
 
 PAGE_SIZE = 6
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', 30))
+PAGINATION_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATE_THRESHOLD', 100000))
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -150,4 +186,22 @@ MAX_SLUG_LENGTH = 150
 MAX_TEXT_LENGTH = 32767
 MAX_SMALL_INT_VALUE = 32767
 MIN_SMALL_INT_VALUE = 1
+RECIPE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_SIZE = (1920, 1920)
+RECIPE_MAX_REQUEST_BYTES = RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 1024 * 1024
+RECIPE_IMAGE_VARIANTS = {
+    'list': (480, 480),
+    'detail': (1024, 1024),
+}
+RECIPE_IMAGE_QUALITY = 85
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_QUEUE_SIZE = int(os.getenv('RECIPE_IMAGE_QUEUE_SIZE', 32))
+RECIPE_FRAGMENT_CACHE_TTL = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TTL', 24 * 60 * 60))
+FEED_FANOUT_THRESHOLD = int(os.getenv('FEED_FANOUT_THRESHOLD', 500))
+FEED_TIMELINE_SIZE = int(os.getenv('FEED_TIMELINE_SIZE', 1000))
 SHOPING_CARD_NAME = "Список покупок.txt"
+SHOPPING_CART_CHUNK_SIZE = 500
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
@@ -13,39 +13,55 @@ from .models import (
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
+    search_fields = ('name', 'slug')
     prepopulated_fields = {'slug': ('name',)}
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name',)
+    show_full_result_count = False
 
 
 class IngredientInRecipe(admin.TabularInline):
-    model = Recipe.ingredients.through
+    model = IngredientsAmount
+    autocomplete_fields = ('ingredient',)
+    extra = 0
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'cooking_time')
-    list_filter = ('name', 'author', 'tags')
-    search_fields = ('name', 'author__username', 'tags__name')
-    filter_horizontal = ('ingredients', 'tags')
+    list_display = ('name', 'author', 'cooking_time', 'favorites_count')
+    list_select_related = ('author',)
+    list_filter = ('tags',)
+    search_fields = ('name', 'author__username', 'author__email')
+    autocomplete_fields = ('author', 'tags')
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
     inlines = [IngredientInRecipe]
+    show_full_result_count = False
 
 
 @admin.register(IngredientsAmount)
 class IngredientsAmountAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+    show_full_result_count = False
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
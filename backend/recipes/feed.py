@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+
+from users.models import Follow
+
+from .models import Recipe, Timeline, TimelineEntry
+
+BATCH_SIZE = 1000
+# Порядок ленты по аннотациям get_feed: для материализованных лент
+# они указывают на столбцы TimelineEntry и индекс ленты.
+FEED_ORDERING = ('-feed_pub_date', '-feed_id')
+FEED_FIELDS = tuple(field.lstrip('-') for field in FEED_ORDERING)
+
+
+def has_timeline(user_id):
+    return Timeline.objects.filter(user_id=user_id).exists()
+
+
+def get_feed(user):
+    """Рецепты авторов, на которых подписан пользователь.
+
+    Для пользователей с материализованной лентой читается таблица
+    TimelineEntry (только последние ``FEED_TIMELINE_SIZE`` рецептов),
+    для остальных рецепты собираются по подпискам при чтении.
+    Рецепты упорядочены по аннотациям ``FEED_FIELDS``: у лент это
+    столбцы TimelineEntry, и сортировка идёт по индексу
+    (user, -pub_date, -recipe) без обращения к таблице рецептов.
+    """
+    if has_timeline(user.id):
+        recipes = Recipe.objects.filter(timeline_entries__user=user).annotate(
+            feed_pub_date=F('timeline_entries__pub_date'),
+            feed_id=F('timeline_entries__recipe_id'),
+        )
+    else:
+        recipes = Recipe.objects.filter(author__following__user=user).annotate(
+            feed_pub_date=F('pub_date'),
+            feed_id=F('id'),
+        )
+    return recipes.order_by(*FEED_ORDERING)
+
+
+def timeline_entries(user_id, recipes):
+    return (
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, pub_date=pub_date)
+        for recipe_id, author_id, pub_date in recipes.order_by(
+            '-pub_date', '-id').values_list(
+                'id', 'author_id', 'pub_date')[:settings.FEED_TIMELINE_SIZE]
+    )
+
+
+@transaction.atomic
+def materialize_timeline(user_id):
+    """Создаёт или пересобирает ленту пользователя с нуля."""
+    Timeline.objects.get_or_create(user_id=user_id)
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    TimelineEntry.objects.bulk_create(
+        timeline_entries(user_id, Recipe.objects.filter(
+            author__following__user_id=user_id)),
+        batch_size=BATCH_SIZE,
+    )
+
+
+@transaction.atomic
+def drop_timeline(user_id):
+    Timeline.objects.filter(user_id=user_id).delete()
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+
+
+def trim_timelines(user_ids):
+    """Оставляет в лентах только ``FEED_TIMELINE_SIZE`` новейших записей."""
+    first_extra = TimelineEntry.objects.filter(
+        user_id=OuterRef('user_id'),
+    ).order_by('-pub_date', '-recipe_id')[
+        settings.FEED_TIMELINE_SIZE:settings.FEED_TIMELINE_SIZE + 1]
+    TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        extra_pub_date=Subquery(first_extra.values('pub_date')),
+        extra_recipe_id=Subquery(first_extra.values('recipe_id')),
+    ).filter(
+        Q(pub_date__lt=F('extra_pub_date'))
+        | Q(pub_date=F('extra_pub_date'),
+            recipe_id__lte=F('extra_recipe_id'))
+    ).delete()
+
+
+def fan_out_recipe(recipe):
+    """Добавляет новый рецепт в материализованные ленты подписчиков."""
+    user_ids = Follow.objects.filter(
+        author_id=recipe.author_id, user__timeline__isnull=False,
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+         for user_id in user_ids.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timelines(user_ids)
+
+
+def follow_added(user_id, author_id):
+    if has_timeline(user_id):
+        TimelineEntry.objects.bulk_create(
+            timeline_entries(user_id, Recipe.objects.filter(
+                author_id=author_id)),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        trim_timelines([user_id])
+    elif Follow.objects.filter(
+            user_id=user_id).count() >= settings.FEED_FANOUT_THRESHOLD:
+        materialize_timeline(user_id)
+
+
+def follow_removed(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_timelines():
+    """Пересобирает ленты по текущим подпискам.
+
+    Ленты получают пользователи, у которых не меньше
+    ``FEED_FANOUT_THRESHOLD`` подписок, у остальных ленты удаляются.
+    """
+    heavy = set(Follow.objects.values('user_id').annotate(
+        follows=Count('id')).filter(
+            follows__gte=settings.FEED_FANOUT_THRESHOLD).values_list(
+                'user_id', flat=True))
+    stale = set(Timeline.objects.exclude(user_id__in=heavy).values_list(
+        'user_id', flat=True))
+    for user_id in stale:
+        drop_timeline(user_id)
+    for user_id in heavy:
+        materialize_timeline(user_id)
+    return len(heavy), len(stale)
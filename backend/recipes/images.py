@@ -0,0 +1,138 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ('image', 'image_list', 'image_detail', 'image_webp')
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(settings.RECIPE_IMAGE_QUEUE_SIZE)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    return _executor
+
+
+def schedule_recipe_image(recipe_id):
+    """Ставит обработку изображения в очередь после коммита.
+
+    Если очередь заполнена, задача пропускается: изображение останется
+    без вариантов до запуска ``process_recipe_images``. При
+    ``RECIPE_IMAGE_WORKERS = 0`` изображение обрабатывается сразу.
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+        return
+    transaction.on_commit(lambda: submit_recipe_image(recipe_id))
+
+
+def get_image_names(recipe):
+    """Файлы изображения рецепта и его вариантов."""
+    return {getattr(recipe, field).name for field in IMAGE_FIELDS} - {''}
+
+
+def delete_images(names):
+    """Удаляет файлы после коммита: при откате рецепт сохранит их."""
+    storage = Recipe._meta.get_field('image').storage
+
+    def delete():
+        for name in names:
+            storage.delete(name)
+
+    if names:
+        transaction.on_commit(delete)
+
+
+def submit_recipe_image(recipe_id):
+    if not _slots.acquire(blocking=False):
+        logger.warning('Очередь изображений заполнена, рецепт %s пропущен',
+                       recipe_id)
+        return
+    try:
+        get_executor().submit(run_recipe_image, recipe_id)
+    except RuntimeError:
+        _slots.release()
+        raise
+
+
+def run_recipe_image(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        _slots.release()
+        connections.close_all()
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(buffer, image_format,
+               quality=settings.RECIPE_IMAGE_QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def resized(image, size):
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+def process_recipe_image(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    source_name = recipe.image.name
+    with recipe.image.open('rb') as image_file:
+        image = Image.open(image_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    storage = recipe.image.storage
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    directory = os.path.dirname(source_name)
+    names = {}
+    max_width, max_height = settings.RECIPE_IMAGE_MAX_SIZE
+    if image.width > max_width or image.height > max_height:
+        image = resized(image, settings.RECIPE_IMAGE_MAX_SIZE)
+        image_format = 'PNG' if image.mode in ('RGBA', 'LA', 'P') else 'JPEG'
+        extension = 'png' if image_format == 'PNG' else 'jpg'
+        names['image'] = storage.save(
+            os.path.join(directory, f'{stem}_full.{extension}'),
+            encode(image, image_format))
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        names[f'image_{variant}'] = storage.save(
+            os.path.join(directory, f'{stem}_{variant}.jpg'),
+            encode(resized(image, size), 'JPEG'))
+    names['image_webp'] = storage.save(
+        os.path.join(directory, f'{stem}.webp'), encode(image, 'WEBP'))
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=source_name).update(**names)
+    if not updated:
+        for name in names.values():
+            storage.delete(name)
+        return
+    if 'image' in names:
+        storage.delete(source_name)
+    bump_version(f'recipe:{recipe_id}')
@@ -0,0 +1,555 @@
+import base64
+import io
+import json
+import math
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import get_resolver
+from django.utils import timezone
+from djoser.utils import encode_uid
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientsAmount,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import rebuild_index
+from users.models import Follow
+
+User = get_user_model()
+
+PASSWORD = 'Benchmark-password-1'
+EMAIL_DOMAIN = 'benchmark.invalid'
+TOKENS = {
+    'reader': 'benchmark0000000000000000000000000reader',
+    'session': 'benchmark000000000000000000000000session',
+}
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark_api',
+    },
+}
+PERCENTILES = (50, 90, 95, 99)
+
+Scenario = namedtuple(
+    'Scenario',
+    ('name', 'route', 'method', 'path', 'data', 'user', 'status',
+     'prepare', 'undo'),
+    defaults=(None, 'reader', None, None, None),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def resolve(value, state):
+    return value(state) if callable(value) else value
+
+
+class Command(BaseCommand):
+    help = ('Замеряет все маршруты api.urls на синтетических данных: '
+            'перцентили времени ответа, число SQL-запросов и пиковую '
+            'память. Данные откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Избранных рецептов на пользователя.')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Рецептов в корзине на пользователя.')
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only', nargs='+',
+            help='Замерить только сценарии, в названии которых есть '
+                 'одна из подстрок.')
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого запуска для сравнения.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root,
+                                      CACHES=BENCHMARK_CACHES), \
+                    transaction.atomic():
+                state = self.seed(options)
+                scenarios = self.get_scenarios(state)
+                uncovered = sorted(
+                    self.get_route_names()
+                    - {scenario.route for scenario in scenarios})
+                if options['only']:
+                    scenarios = [
+                        scenario for scenario in scenarios
+                        if any(part in scenario.name
+                               for part in options['only'])
+                    ]
+                results = {
+                    scenario.name: self.measure(scenario, state, options)
+                    for scenario in scenarios
+                }
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+        report = {
+            'vendor': connection.vendor,
+            'created': timezone.now().isoformat(),
+            'volumes': {
+                name: options[name] for name in (
+                    'users', 'recipes', 'ingredients_per_recipe',
+                    'tags_per_recipe', 'favorites', 'carts', 'follows')
+            },
+            'repeat': options['repeat'],
+            'uncovered_routes': uncovered,
+            'results': results,
+        }
+        self.print_report(report)
+        if uncovered:
+            self.stderr.write(
+                f'Нет сценариев для маршрутов: {", ".join(uncovered)}')
+        if options['compare']:
+            with open(options['compare'], 'r', encoding='utf-8') as file:
+                self.print_comparison(json.load(file), report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def get_route_names(self):
+        return {
+            name for name in get_resolver('api.urls').reverse_dict
+            if isinstance(name, str)
+        }
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        if Ingredient.objects.count() < options['ingredients_per_recipe']:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ингредиент {number}',
+                           measurement_unit='г')
+                for number in range(500))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=f'Тег {number}', color=f'#00000{number}',
+                    slug=f'benchmark-{number}')
+                for number in range(3))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        words = list(Ingredient.objects.values_list('name', flat=True)[:500])
+
+        User.objects.bulk_create(
+            (User(username=f'benchmark{number}',
+                  email=f'benchmark{number}@{EMAIL_DOMAIN}',
+                  first_name='Имя', last_name='Фамилия', password='!')
+             for number in range(max(options['users'], 4))),
+            batch_size=batch_size)
+        users = User.objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}').order_by('id')
+        user_ids = list(users.values_list('id', flat=True))
+        reader, spare, session, target = users[0], users[1], users[2], \
+            user_ids[-1]
+        for user in (reader, spare, session):
+            user.set_password(PASSWORD)
+            user.save(update_fields=['password'])
+        Token.objects.bulk_create([
+            Token(key=TOKENS['reader'], user=reader),
+            Token(key=TOKENS['session'], user=session),
+        ])
+
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=user_ids[0] if number == 0
+                    else rng.choice(user_ids),
+                    name=' '.join(rng.sample(words, 2)),
+                    text=' '.join(rng.choices(words, k=30)),
+                    cooking_time=rng.randint(1, 180),
+                    image='food/recipe/benchmark.jpg')
+             for number in range(max(options['recipes'], 2))),
+            batch_size=batch_size)
+        recipes = Recipe.objects.filter(
+            author__email__endswith=f'@{EMAIL_DOMAIN}').order_by('id')
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in rng.sample(
+                 tag_ids, min(options['tags_per_recipe'], len(tag_ids)))),
+            batch_size=batch_size)
+        IngredientsAmount.objects.bulk_create(
+            (IngredientsAmount(recipe_id=recipe_id,
+                               ingredient_id=ingredient_id,
+                               amount=rng.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in rng.sample(
+                 ingredient_ids, options['ingredients_per_recipe'])),
+            batch_size=batch_size)
+        for model, count in ((Favorite, options['favorites']),
+                             (ShoppingCart, options['carts'])):
+            model.objects.bulk_create(
+                (model(user_id=user_id, recipe_id=recipe_id)
+                 for user_id in user_ids
+                 for recipe_id in rng.sample(
+                     recipe_ids[:-1], min(count, len(recipe_ids) - 1))),
+                batch_size=batch_size)
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id in user_ids
+             for author_id in rng.sample(
+                 user_ids[:-1], min(options['follows'], len(user_ids) - 1))
+             if author_id != user_id),
+            batch_size=batch_size)
+        rebuild_index()
+        call_command('rebuild_shopping_cart_totals', stdout=io.StringIO())
+        call_command('reconcile_recipe_counters', stdout=io.StringIO())
+        return {
+            'reader': reader,
+            'spare': spare,
+            'session': session,
+            'target_user': target,
+            'own_recipe': recipe_ids[0],
+            'recipe': recipe_ids[len(recipe_ids) // 2],
+            'target_recipe': recipe_ids[-1],
+            'tag_ids': tag_ids,
+            'ingredient_ids': ingredient_ids,
+            'word': words[0] if words else 'рецепт',
+            'counter': 0,
+            'clients': {
+                None: Client(raise_request_exception=False),
+                'reader': Client(
+                    raise_request_exception=False,
+                    HTTP_AUTHORIZATION=f'Token {TOKENS["reader"]}'),
+                'session': Client(
+                    raise_request_exception=False,
+                    HTTP_AUTHORIZATION=f'Token {TOKENS["session"]}'),
+            },
+        }
+
+    def get_scenarios(self, state):
+        reader = state['reader']
+        spare = state['spare']
+        own = state['own_recipe']
+        recipe = state['recipe']
+        target = state['target_recipe']
+        target_user = state['target_user']
+        tag = Tag.objects.get(id=state['tag_ids'][0])
+        ingredient = state['ingredient_ids'][0]
+        image = io.BytesIO()
+        Image.new('RGB', (64, 64)).save(image, 'PNG')
+        image = ('data:image/png;base64,'
+                 + base64.b64encode(image.getvalue()).decode())
+
+        def next_number(state):
+            state['counter'] += 1
+            return state['counter']
+
+        def recipe_data(state):
+            number = next_number(state)
+            return {
+                'name': f'Рецепт {number}',
+                'text': 'Описание',
+                'cooking_time': number % 100 + 1,
+                'tags': state['tag_ids'][:1],
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': number % 50 + 1}
+                    for ingredient_id in state['ingredient_ids'][:5]
+                ],
+            }
+
+        def confirm_data(state, **data):
+            user = User.objects.get(id=spare.id)
+            return {
+                'uid': encode_uid(user.pk),
+                'token': default_token_generator.make_token(user),
+                **data,
+            }
+
+        def create_recipe(state):
+            created = Recipe.objects.create(
+                author=reader, name='Удаляемый рецепт', text='Описание',
+                cooking_time=1, image='food/recipe/benchmark.jpg')
+            IngredientsAmount.objects.create(
+                recipe=created, ingredient_id=ingredient, amount=1)
+            created.tags.set(state['tag_ids'][:1])
+            state['recipe_to_delete'] = created.id
+
+        def reset_email(user):
+            return lambda state, response: User.objects.filter(
+                id=user.id).update(email=user.email)
+
+        def relation(model, **lookup):
+            return {
+                'add': lambda state: model.objects.create(**lookup),
+                'remove': lambda state, response=None: model.objects.filter(
+                    **lookup).delete(),
+            }
+
+        favorite = relation(Favorite, user=reader, recipe_id=target)
+        cart = relation(ShoppingCart, user=reader, recipe_id=target)
+        follow = relation(Follow, user=reader, author_id=target_user)
+        return [
+            Scenario('api-root', 'api-root', 'get', '/api/'),
+            Scenario('users-list anonymous', 'users-list', 'get',
+                     '/api/users/?limit=6', user=None),
+            Scenario('users-list', 'users-list', 'get', '/api/users/?limit=6'),
+            Scenario('users-create', 'users-list', 'post', '/api/users/',
+                     lambda state: {
+                         'email': f'new{next_number(state)}@{EMAIL_DOMAIN}',
+                         'username': f'new{state["counter"]}',
+                         'first_name': 'Имя',
+                         'last_name': 'Фамилия',
+                         'password': PASSWORD,
+                     }, user=None, status=201,
+                     undo=lambda state, response: User.objects.filter(
+                         id=response.json()['id']).delete()),
+            Scenario('users-detail', 'users-detail', 'get',
+                     f'/api/users/{target_user}/'),
+            Scenario('users-me', 'users-me', 'get', '/api/users/me/'),
+            Scenario('users-subscriptions', 'users-subscriptions', 'get',
+                     '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+            Scenario('users-subscribe POST', 'users-subscribe', 'post',
+                     f'/api/users/{target_user}/subscribe/', status=201,
+                     undo=follow['remove']),
+            Scenario('users-subscribe DELETE', 'users-subscribe', 'delete',
+                     f'/api/users/{target_user}/subscribe/', status=204,
+                     prepare=follow['add']),
+            Scenario('users-set-password', 'users-set-password', 'post',
+                     '/api/users/set_password/',
+                     {'current_password': PASSWORD,
+                      'new_password': PASSWORD}, status=204),
+            Scenario('users-set-username', 'users-set-username', 'post',
+                     '/api/users/set_email/',
+                     lambda state: {
+                         'current_password': PASSWORD,
+                         'new_email':
+                             f'changed{next_number(state)}@{EMAIL_DOMAIN}',
+                     }, status=204, undo=reset_email(reader)),
+            Scenario('users-activation', 'users-activation', 'post',
+                     '/api/users/activation/', confirm_data,
+                     user=None, status=204,
+                     prepare=lambda state: User.objects.filter(
+                         id=spare.id).update(is_active=False)),
+            Scenario('users-resend-activation', 'users-resend-activation',
+                     'post', '/api/users/resend_activation/',
+                     {'email': spare.email}, user=None, status=400),
+            Scenario('users-reset-password', 'users-reset-password', 'post',
+                     '/api/users/reset_password/', {'email': reader.email},
+                     user=None, status=204),
+            Scenario('users-reset-password-confirm',
+                     'users-reset-password-confirm', 'post',
+                     '/api/users/reset_password_confirm/',
+                     lambda state: confirm_data(
+                         state, new_password=PASSWORD),
+                     user=None, status=204),
+            Scenario('users-reset-username', 'users-reset-username', 'post',
+                     '/api/users/reset_email/', {'email': reader.email},
+                     user=None, status=204),
+            Scenario('users-reset-username-confirm',
+                     'users-reset-username-confirm', 'post',
+                     '/api/users/reset_email_confirm/',
+                     lambda state: confirm_data(
+                         state, new_email=f'reset{next_number(state)}'
+                                          f'@{EMAIL_DOMAIN}'),
+                     user=None, status=204, undo=reset_email(spare)),
+            Scenario('login', 'login', 'post', '/api/auth/token/login/',
+                     {'email': state['session'].email,
+                      'password': PASSWORD}, user=None, status=200),
+            Scenario('logout', 'logout', 'post', '/api/auth/token/logout/',
+                     user='session', status=204,
+                     prepare=lambda state: Token.objects.get_or_create(
+                         key=TOKENS['session'], user=state['session'])),
+            Scenario('tags-list', 'tags-list', 'get', '/api/tags/',
+                     user=None),
+            Scenario('tags-detail', 'tags-detail', 'get',
+                     f'/api/tags/{tag.id}/', user=None),
+            Scenario('ingredients-list', 'ingredients-list', 'get',
+                     '/api/ingredients/', user=None),
+            Scenario('ingredients-list search', 'ingredients-list', 'get',
+                     f'/api/ingredients/?name={state["word"][:3]}',
+                     user=None),
+            Scenario('ingredients-detail', 'ingredients-detail', 'get',
+                     f'/api/ingredients/{ingredient}/', user=None),
+            Scenario('recipes-list anonymous', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6', user=None),
+            Scenario('recipes-list', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6'),
+            Scenario('recipes-list page 10', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6&page=10'),
+            Scenario('recipes-list cursor', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6&cursor='),
+            Scenario('recipes-list is_favorited', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6&is_favorited=1'),
+            Scenario('recipes-list is_in_shopping_cart', 'recipes-list',
+                     'get', '/api/recipes/?limit=6&is_in_shopping_cart=1'),
+            Scenario('recipes-list tags', 'recipes-list', 'get',
+                     f'/api/recipes/?limit=6&tags={tag.slug}'),
+            Scenario('recipes-list author', 'recipes-list', 'get',
+                     f'/api/recipes/?limit=6&author={reader.id}'),
+            Scenario('recipes-list popular', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6&ordering=popular'),
+            Scenario('recipes-list popular cursor', 'recipes-list', 'get',
+                     '/api/recipes/?limit=6&ordering=popular&cursor='),
+            Scenario('recipes-list search', 'recipes-list', 'get',
+                     f'/api/recipes/?limit=6&search={state["word"]}'),
+            Scenario('recipes-feed', 'recipes-feed', 'get',
+                     '/api/recipes/feed/?limit=6'),
+            Scenario('recipes-create', 'recipes-list', 'post',
+                     '/api/recipes/',
+                     lambda state: {**recipe_data(state), 'image': image},
+                     status=201,
+                     undo=lambda state, response: Recipe.objects.filter(
+                         id=response.json()['id']).delete()),
+            Scenario('recipes-detail anonymous', 'recipes-detail', 'get',
+                     f'/api/recipes/{recipe}/', user=None),
+            Scenario('recipes-detail', 'recipes-detail', 'get',
+                     f'/api/recipes/{recipe}/'),
+            Scenario('recipes-detail PATCH', 'recipes-detail', 'patch',
+                     f'/api/recipes/{own}/', recipe_data),
+            Scenario('recipes-detail DELETE', 'recipes-detail', 'delete',
+                     lambda state: f'/api/recipes/'
+                                   f'{state["recipe_to_delete"]}/',
+                     status=204, prepare=create_recipe),
+            Scenario('recipes-favorite POST', 'recipes-favorite', 'post',
+                     f'/api/recipes/{target}/favorite/', status=201,
+                     undo=favorite['remove']),
+            Scenario('recipes-favorite DELETE', 'recipes-favorite', 'delete',
+                     f'/api/recipes/{target}/favorite/', status=204,
+                     prepare=favorite['add']),
+            Scenario('recipes-shopping-cart POST', 'recipes-shopping-cart',
+                     'post', f'/api/recipes/{target}/shopping_cart/',
+                     status=201, undo=cart['remove']),
+            Scenario('recipes-shopping-cart DELETE', 'recipes-shopping-cart',
+                     'delete', f'/api/recipes/{target}/shopping_cart/',
+                     status=204, prepare=cart['add']),
+        ] + [
+            Scenario(f'recipes-download-shopping-cart {format}',
+                     'recipes-download-shopping-cart', 'get',
+                     f'/api/recipes/download_shopping_cart/?format={format}')
+            for format in ('txt', 'csv', 'pdf')
+        ]
+
+    def request(self, scenario, state):
+        client = state['clients'][scenario.user]
+        path = resolve(scenario.path, state)
+        if scenario.method == 'get':
+            response = client.get(path)
+        else:
+            response = getattr(client, scenario.method)(
+                path, resolve(scenario.data, state) or {},
+                content_type='application/json')
+        if response.streaming:
+            response.content_length = len(
+                b''.join(response.streaming_content))
+        else:
+            response.content_length = len(response.content)
+        return response
+
+    def call(self, scenario, state, trace_memory=False):
+        if scenario.prepare:
+            scenario.prepare(state)
+        with CaptureQueriesContext(connection) as queries:
+            if trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            response = self.request(scenario, state)
+            elapsed = (time.perf_counter() - started) * 1000
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        expected = scenario.status
+        if (response.status_code != expected if expected
+                else response.status_code >= 400):
+            self.stderr.write(
+                f'{scenario.name}: ответ {response.status_code}')
+        if scenario.undo and response.status_code < 400:
+            scenario.undo(state, response)
+        return {
+            'response': response,
+            'elapsed': elapsed,
+            'queries': len(queries),
+            'peak': peak if trace_memory else None,
+        }
+
+    def measure(self, scenario, state, options):
+        for _ in range(options['warmup']):
+            self.call(scenario, state)
+        calls = [self.call(scenario, state) for _ in range(options['repeat'])]
+        traced = self.call(scenario, state, trace_memory=True)
+        timings = [call['elapsed'] for call in calls]
+        queries = [call['queries'] for call in calls]
+        result = {
+            'route': scenario.route,
+            'method': scenario.method.upper(),
+            'status': traced['response'].status_code,
+            'bytes': traced['response'].content_length,
+            'mean_ms': round(statistics.mean(timings), 3),
+            'min_ms': round(min(timings), 3),
+            'max_ms': round(max(timings), 3),
+        }
+        for percent in PERCENTILES:
+            result[f'p{percent}_ms'] = round(
+                percentile(timings, percent), 3)
+        result['queries'] = max(queries)
+        result['peak_memory_kb'] = round(traced['peak'] / 1024, 1)
+        return result
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{report["vendor"]}, {report["volumes"]}, '
+            f'повторов: {report["repeat"]}')
+        self.stdout.write(
+            f'{"сценарий":<40}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"p99, мс":>10}{"запросы":>9}{"память, КБ":>12}')
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<40}{result["p50_ms"]:>10.2f}'
+                f'{result["p95_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+                f'{result["queries"]:>9}{result["peak_memory_kb"]:>12.1f}')
+
+    def print_comparison(self, previous, report):
+        self.stdout.write(
+            f'\nСравнение с запуском {previous.get("created")}:')
+        self.stdout.write(
+            f'{"сценарий":<40}{"p50 было":>10}{"p50 стало":>11}'
+            f'{"Δ, %":>8}{"запросы":>12}')
+        for name, result in report['results'].items():
+            old = previous['results'].get(name)
+            if old is None:
+                continue
+            change = ((result['p50_ms'] - old['p50_ms'])
+                      / old['p50_ms'] * 100 if old['p50_ms'] else 0)
+            self.stdout.write(
+                f'{name:<40}{old["p50_ms"]:>10.2f}{result["p50_ms"]:>11.2f}'
+                f'{change:>+8.1f}'
+                f'{old["queries"]:>6} → {result["queries"]:<4}')
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.benchmark_api import percentile
+from recipes.models import Ingredient, Recipe, ShoppingCart
+
+UVICORN = ['--worker-class', 'uvicorn.workers.UvicornWorker',
+           'foodgram.asgi:application']
+# Сервер: (аргументы gunicorn, асинхронные представления чтения).
+DEPLOYMENTS = {
+    'wsgi': (['foodgram.wsgi:application'], False),
+    'asgi': (UVICORN, True),
+    'asgi-sync': (UVICORN, False),
+}
+CALIBRATION_REQUESTS = 200
+START_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) / 1024
+    return 0
+
+
+def child_pids(pid):
+    children = []
+    for stat in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            fields = stat.read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(stat.parent.name))
+    return children
+
+
+async def fetch(port, path, headers):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: localhost\r\n'
+            f'{headers}Connection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    head = head.lower()
+    if b'transfer-encoding: chunked' in head and not body.endswith(
+            b'0\r\n\r\n'):
+        # Заголовки уже отправлены, а тело оборвалось.
+        return 'обрыв'
+    return status
+
+
+class Server:
+    """gunicorn с выбранным типом воркеров на свободном порту."""
+
+    def __init__(self, kind, workers, threads):
+        self.kind = kind
+        self.workers = workers
+        self.port = free_port()
+        arguments, async_views = DEPLOYMENTS[kind]
+        env = {**os.environ, 'ASYNC_READ_VIEWS': str(async_views)}
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn',
+             '--bind', f'127.0.0.1:{self.port}',
+             '--workers', str(workers), '--threads', str(threads),
+             '--log-level', 'warning', *arguments],
+            cwd=settings.BASE_DIR, env=env,
+        )
+
+    def wait(self, path):
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f'{self.kind}: gunicorn завершился '
+                                   f'с кодом {self.process.returncode}')
+            if len(child_pids(self.process.pid)) == self.workers:
+                try:
+                    asyncio.run(fetch(self.port, path, ''))
+                    return
+                except OSError:
+                    pass
+            time.sleep(0.2)
+        raise CommandError(f'{self.kind}: сервер не запустился '
+                           f'за {START_TIMEOUT} с')
+
+    def memory(self):
+        """RSS мастера и воркеров, МБ."""
+        return rss_mb(self.process.pid), [
+            rss_mb(pid) for pid in child_pids(self.process.pid)]
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест горячих маршрутов чтения: gunicorn с '
+            'синхронными воркерами (WSGI) против воркеров uvicorn (ASGI, '
+            'асинхронные представления чтения) при одинаковом бюджете '
+            'памяти. Число воркеров подбирается по замеренному RSS '
+            'воркера. Только Linux, нужна база с данными.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--memory-mb', type=int, default=512,
+                            help='Бюджет RSS на весь сервер.')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--wsgi-threads', type=int, default=1)
+        parser.add_argument('--deployments', nargs='+', choices=DEPLOYMENTS,
+                            default=list(DEPLOYMENTS),
+                            help='asgi-sync — ASGI без асинхронных '
+                                 'представлений.')
+        parser.add_argument('--paths', nargs='+',
+                            help='По умолчанию: список и страница рецепта, '
+                                 'поиск ингредиентов, теги, корзина.')
+
+    def handle(self, *args, **options):
+        if not Path('/proc/self/status').exists():
+            raise CommandError('Для замера памяти нужен /proc (Linux).')
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('Для ASGI нужен пакет uvicorn.')
+        token, created = self.get_token()
+        try:
+            paths = options['paths'] or self.default_paths()
+            headers = f'Authorization: Token {token.key}\r\n'
+            self.stdout.write(
+                f'Бюджет {options["memory_mb"]} МБ, '
+                f'одновременно {options["concurrency"]}, '
+                f'{options["duration"]} с на сервер')
+            self.stdout.write(f'Маршруты: {", ".join(paths)}')
+            self.stdout.write(
+                f'{"сервер":<10}{"воркеры":>9}{"RSS, МБ":>9}{"запр/с":>9}'
+                f'{"p50, мс":>9}{"p99, мс":>9}{"ошибки":>8}')
+            for kind in options['deployments']:
+                self.measure(kind, paths, headers, options)
+        finally:
+            if created:
+                token.delete()
+
+    def get_token(self):
+        cart = ShoppingCart.objects.select_related('user').first()
+        if cart is None:
+            raise CommandError('Нет ни одной корзины покупок: '
+                               'загрузите данные (import_recipes).')
+        return Token.objects.get_or_create(user=cart.user)
+
+    def default_paths(self):
+        recipe_id = Recipe.objects.order_by('-pub_date').values_list(
+            'id', flat=True).first()
+        name = Ingredient.objects.values_list('name', flat=True).first()
+        return [
+            '/api/recipes/?limit=6',
+            f'/api/recipes/{recipe_id}/',
+            f'/api/ingredients/?name={name[:3]}',
+            '/api/tags/',
+            '/api/recipes/download_shopping_cart/',
+        ]
+
+    def calibrate(self, kind, paths, headers, options):
+        """Число воркеров, укладывающееся в бюджет памяти.
+
+        RSS воркера замеряется после прогрева: у прогретого воркера
+        заполнены кэши и открыты соединения с базой.
+        """
+        server = Server(kind, 1, options['wsgi_threads'])
+        try:
+            server.wait(paths[0])
+            asyncio.run(self.load(
+                server.port, paths, headers, options['concurrency'],
+                requests=CALIBRATION_REQUESTS))
+            master, workers = server.memory()
+        finally:
+            server.stop()
+        return max(1, int((options['memory_mb'] - master) // max(workers)))
+
+    def measure(self, kind, paths, headers, options):
+        workers = self.calibrate(kind, paths, headers, options)
+        server = Server(kind, workers, options['wsgi_threads'])
+        try:
+            server.wait(paths[0])
+            asyncio.run(self.load(
+                server.port, paths, headers, options['concurrency'],
+                requests=CALIBRATION_REQUESTS))
+            started = time.perf_counter()
+            timings, statuses = asyncio.run(self.load(
+                server.port, paths, headers, options['concurrency'],
+                duration=options['duration']))
+            elapsed = time.perf_counter() - started
+            master, worker_rss = server.memory()
+        finally:
+            server.stop()
+        errors = sum(count for status, count in statuses.items()
+                     if status != 200)
+        self.stdout.write(
+            f'{kind:<10}{workers:>9}{master + sum(worker_rss):>9.0f}'
+            f'{len(timings) / elapsed:>9.1f}'
+            f'{percentile(timings, 50):>9.1f}'
+            f'{percentile(timings, 99):>9.1f}{errors:>8}')
+        if errors:
+            self.stderr.write(f'{kind}: ответы {dict(statuses)}')
+
+    async def load(self, port, paths, headers, concurrency,
+                   duration=None, requests=None):
+        """Клиенты по кругу запрашивают маршруты до конца времени
+        или пока не будет сделано ``requests`` запросов."""
+        timings = []
+        statuses = Counter()
+        deadline = time.perf_counter() + (duration or float('inf'))
+
+        async def client(number):
+            index = number
+            while time.perf_counter() < deadline and (
+                    requests is None or len(timings) < requests):
+                started = time.perf_counter()
+                try:
+                    status = await fetch(
+                        port, paths[index % len(paths)], headers)
+                except OSError:
+                    status = 'соединение'
+                timings.append((time.perf_counter() - started) * 1000)
+                statuses[status] += 1
+                index += 1
+
+        await asyncio.gather(*(client(number)
+                               for number in range(concurrency)))
+        return timings, statuses
@@ -0,0 +1,165 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from rest_framework.authtoken.models import Token
+
+from recipes.feed import drop_timeline, materialize_timeline
+from recipes.management.commands.benchmark_api import (
+    BENCHMARK_CACHES,
+    percentile,
+)
+from recipes.models import Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'feed.benchmark.invalid'
+MODES = {
+    'fan-in': drop_timeline,
+    'fan-out': materialize_timeline,
+}
+
+
+class Command(BaseCommand):
+    help = ('Замеряет /api/recipes/feed/ для пользователей с разным '
+            'числом подписок в обоих режимах: сборка ленты при чтении '
+            'и материализованная лента. Данные откатываются после '
+            'замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follows', type=int, nargs='+',
+                            default=[10, 1000, 10000])
+        parser.add_argument('--recipes-per-author', type=int, default=3)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не очищать кэш перед запросами (счётчики и фрагменты).')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES), \
+                    transaction.atomic():
+                viewers = self.seed(options)
+                self.stdout.write(
+                    f'{connection.vendor}, авторов: {max(options["follows"])}'
+                    f', рецептов на автора: {options["recipes_per_author"]}'
+                    f', повторов: {options["repeat"]}')
+                self.stdout.write(
+                    f'{"подписок":>9} {"режим":<8} {"страница":<10}'
+                    f'{"p50, мс":>10}{"p95, мс":>10}{"запросы":>9}')
+                for follows, viewer in viewers.items():
+                    self.measure_viewer(follows, viewer, options)
+                self.measure_publish(viewers, options)
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        authors = max(options['follows'])
+        User.objects.bulk_create(
+            (User(username=f'feed-author{number}',
+                  email=f'author{number}@{EMAIL_DOMAIN}',
+                  first_name='Имя', last_name='Фамилия', password='!')
+             for number in range(authors)),
+            batch_size=batch_size)
+        author_ids = list(User.objects.filter(
+            email__startswith='author',
+            email__endswith=f'@{EMAIL_DOMAIN}').values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=author_id, name=f'Рецепт {number}',
+                    text='Текст рецепта', cooking_time=10,
+                    image='food/recipe/benchmark.jpg')
+             for number in range(options['recipes_per_author'])
+             for author_id in rng.sample(author_ids, len(author_ids))),
+            batch_size=batch_size)
+        viewers = {}
+        for follows in options['follows']:
+            viewer = User.objects.create(
+                username=f'feed-viewer{follows}',
+                email=f'viewer{follows}@{EMAIL_DOMAIN}',
+                first_name='Имя', last_name='Фамилия', password='!')
+            Follow.objects.bulk_create(
+                (Follow(user=viewer, author_id=author_id)
+                 for author_id in rng.sample(author_ids, follows)),
+                batch_size=batch_size)
+            token = Token.objects.create(user=viewer)
+            viewer.client = Client(
+                raise_request_exception=False,
+                HTTP_AUTHORIZATION=f'Token {token.key}')
+            viewers[follows] = viewer
+        return viewers
+
+    def request(self, viewer, path, options):
+        if not options['warm']:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = viewer.client.get(path)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            self.stderr.write(f'{path}: ответ {response.status_code}')
+        return response, elapsed, len(queries)
+
+    def measure_viewer(self, follows, viewer, options):
+        limit = options['limit']
+        pages = {
+            'первая': f'/api/recipes/feed/?limit={limit}',
+            'вторая': f'/api/recipes/feed/?limit={limit}&page=2',
+            'курсор': f'/api/recipes/feed/?limit={limit}&cursor=',
+        }
+        first_pages = {}
+        for mode, prepare in MODES.items():
+            prepare(viewer.id)
+            for page, path in pages.items():
+                response, _, _ = self.request(viewer, path, options)
+                if page == 'первая':
+                    first_pages[mode] = response.json()['results']
+                calls = [self.request(viewer, path, options)
+                         for _ in range(options['repeat'])]
+                timings = [elapsed for _, elapsed, _ in calls]
+                self.stdout.write(
+                    f'{follows:>9} {mode:<8} {page:<10}'
+                    f'{percentile(timings, 50):>10.2f}'
+                    f'{percentile(timings, 95):>10.2f}'
+                    f'{max(queries for _, _, queries in calls):>9}')
+        if first_pages['fan-in'] != first_pages['fan-out']:
+            self.stderr.write(
+                f'{follows} подписок: первые страницы режимов различаются')
+
+    def measure_publish(self, viewers, options):
+        """Время публикации рецепта автором, на которого подписаны все."""
+        author = Follow.objects.filter(
+            user=viewers[min(viewers)]).values_list(
+                'author_id', flat=True).first()
+        for viewer in viewers.values():
+            Follow.objects.get_or_create(user=viewer, author_id=author)
+            materialize_timeline(viewer.id)
+        timings = []
+        for number in range(options['repeat']):
+            started = time.perf_counter()
+            Recipe.objects.create(
+                author_id=author, name=f'Новый рецепт {number}',
+                text='Текст рецепта', cooking_time=10,
+                image='food/recipe/benchmark.jpg')
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'Публикация рецепта с раздачей в {len(viewers)} лент: '
+            f'p50 {statistics.median(timings):.2f} мс')
@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import (
+    setup_test_environment,
+    teardown_test_environment,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import recipe_rows, serialize_recipe_rows
+from api.serializers import RecipeReadSerializer
+from api.views import recipes_with_relations
+from recipes.models import Recipe
+
+User = get_user_model()
+
+ORDERING = ('-pub_date', '-id')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость быстрого сериализатора рецептов и '
+            'RecipeReadSerializer на одном ядре на текущих данных. '
+            'Совпадение их JSON проверяет api.tests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Рецептов на странице.')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов для замера.')
+        limit = options['limit']
+        viewer = User.objects.annotate(
+            favorites=Count('favorite')).order_by('-favorites').first()
+        setup_test_environment()
+        try:
+            for user in (AnonymousUser(), viewer):
+                request = Request(APIRequestFactory().get('/api/recipes/'))
+                request.user = user
+                self.stdout.write(f'{user}:')
+                self.benchmark(request, limit, options['repeat'])
+        finally:
+            teardown_test_environment()
+
+    def render_slow(self, request, offset, limit):
+        recipes = recipes_with_relations(request.user).order_by(
+            *ORDERING)[offset:offset + limit]
+        return JSONRenderer().render(RecipeReadSerializer(
+            recipes, many=True, context={'request': request}).data)
+
+    def render_fast(self, request, offset, limit):
+        rows = recipe_rows(Recipe.objects.order_by(*ORDERING),
+                           request.user)[offset:offset + limit]
+        return JSONRenderer().render(
+            serialize_recipe_rows(list(rows), request))
+
+    def benchmark(self, request, limit, repeat):
+        for name, render in (('RecipeReadSerializer', self.render_slow),
+                             ('serialize_recipe_rows', self.render_fast)):
+            render(request, 0, limit)
+            wall, cpu = [], []
+            for _ in range(repeat):
+                wall_started = time.perf_counter()
+                cpu_started = time.process_time()
+                render(request, 0, limit)
+                cpu.append(time.process_time() - cpu_started)
+                wall.append(time.perf_counter() - wall_started)
+            cpu_median = statistics.median(cpu)
+            self.stdout.write(
+                f'  {name:<24}'
+                f'{statistics.median(wall) * 1000:>8.2f} мс/страница, '
+                f'{cpu_median * 1000:>8.2f} мс CPU, '
+                f'{limit / cpu_median if cpu_median else 0:>9.0f} '
+                f'рецептов/с на ядро')
@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import Ingredient, Recipe
+from recipes.search import rebuild_index, search_recipes
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает полнотекстовый поиск рецептов с icontains '
+            'на синтетических данных. Данные откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            words = self.seed(options['recipes'], options['batch_size'])
+            queries = random.Random(0).sample(words, 5)
+            self.stdout.write(f'{"запрос":<30}{"search, мс":>14}'
+                              f'{"icontains, мс":>16}')
+            for query in queries:
+                search_time = self.measure(
+                    lambda: search_recipes(Recipe.objects.all(), query),
+                    options['repeat'])
+                icontains_time = self.measure(
+                    lambda: Recipe.objects.filter(
+                        Q(name__icontains=query) | Q(text__icontains=query)),
+                    options['repeat'])
+                self.stdout.write(f'{query:<30}{search_time:>14.2f}'
+                                  f'{icontains_time:>16.2f}')
+            transaction.set_rollback(True)
+
+    def seed(self, count, batch_size):
+        words = list(Ingredient.objects.values_list('name', flat=True)[:500])
+        if not words:
+            words = [f'ингредиент{number}' for number in range(500)]
+        author = User.objects.create(username='benchmark_search',
+                                     email='benchmark_search@example.com')
+        rng = random.Random(count)
+        for start in range(0, count, batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=' '.join(rng.sample(words, 2)),
+                    text=' '.join(rng.choices(words, k=30)),
+                    cooking_time=rng.randint(1, 180),
+                    image='food/recipe/benchmark.jpg',
+                )
+                for _ in range(min(batch_size, count - start))
+            )
+        rebuild_index()
+        return words
+
+    def measure(self, make_queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = make_queryset()
+            queryset.count()
+            list(queryset[:PAGE_SIZE])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import IngredientsAmount, Recipe
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с авторами, тегами и ингредиентами '
+            'в NDJSON, а изображения — в отдельный каталог.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON для выгрузки.')
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог для изображений. Без него выгружаются '
+                 'только имена файлов.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('ingredient_amount',
+                     queryset=IngredientsAmount.objects.select_related(
+                         'ingredient')),
+        ).order_by('id')
+        exported = 0
+        last_id = 0
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            while True:
+                batch = list(
+                    recipes.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                for recipe in batch:
+                    if options['images_dir']:
+                        self.export_image(recipe, options['images_dir'])
+                    file.write(json.dumps(self.serialize(recipe),
+                                          ensure_ascii=False))
+                    file.write('\n')
+                exported += len(batch)
+                last_id = batch[-1].id
+        self.stdout.write(
+            self.style.SUCCESS(f'Выгружено рецептов: {exported}'))
+
+    def serialize(self, recipe):
+        author = recipe.author
+        return {
+            'author': {
+                'email': author.email,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+            },
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'image': recipe.image.name,
+            'tags': [
+                {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+                for tag in recipe.tags.all()
+            ],
+            'ingredients': [
+                {
+                    'name': amount.ingredient.name,
+                    'measurement_unit': amount.ingredient.measurement_unit,
+                    'amount': amount.amount,
+                }
+                for amount in recipe.ingredient_amount.all()
+            ],
+        }
+
+    def export_image(self, recipe, images_dir):
+        if not recipe.image:
+            return
+        path = os.path.join(images_dir, recipe.image.name)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with default_storage.open(recipe.image.name) as source, \
+                    open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+        except FileNotFoundError:
+            self.stderr.write(
+                f'Нет файла изображения {recipe.image.name} '
+                f'у рецепта {recipe.id}')
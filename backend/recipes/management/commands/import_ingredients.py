@@ -1,29 +1,141 @@
+import csv
 import json
 import os
+import re
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+READ_CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file, chunk_size=READ_CHUNK_SIZE):
+    """Разбирает JSON-массив по частям, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    opened = False
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            if not opened:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив.')
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise CommandError('Некорректный JSON.')
+            else:
+                yield item
+                continue
+        elif eof:
+            raise CommandError('Неожиданный конец JSON-файла.')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_json_rows(file):
+    for item in iter_json_array(file):
+        if not isinstance(item, dict):
+            yield None, None
+            continue
+        yield item.get('name'), item.get('measurement_unit')
+
+
+def iter_csv_rows(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            yield None, None
+            continue
+        yield row
+
+
+READERS = {
+    '.json': iter_json_rows,
+    '.csv': iter_csv_rows,
+}
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
-        file_path = 'ingredients.json'
-        DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
-        full_file_path = os.path.join(DATA_ROOT, file_path)
-
-        with open(full_file_path, 'r', encoding='utf-8') as json_file:
-            data = json.load(json_file)
-            ingredients_to_create = []
-
-            for ingredient in data:
-                ingredient_name = ingredient['name']
-                measurement_unit = ingredient['measurement_unit']
-                ingredients_to_create.append(
-                    Ingredient(name=ingredient_name,
-                               measurement_unit=measurement_unit))
-            Ingredient.objects.bulk_create(ingredients_to_create)
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Создано {len(ingredients_to_create)} ингредиентов'))
+    help = ('Загружает ингредиенты из JSON или CSV. Уже существующие '
+            'пары «название — единица измерения» пропускаются, '
+            'поэтому команду можно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.DATA_ROOT, 'ingredients.json'),
+        )
+        parser.add_argument('--format', choices=('json', 'csv'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['format']:
+            suffix = f'.{options["format"]}'
+        else:
+            suffix = os.path.splitext(path)[1].lower()
+        if suffix not in READERS:
+            raise CommandError(
+                'Не удалось определить формат файла, укажите --format.')
+        self.inserted = self.skipped = self.invalid = 0
+        batch = {}
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            for name, measurement_unit in READERS[suffix](file):
+                key = self.clean(name, measurement_unit)
+                if key is None:
+                    self.invalid += 1
+                elif key in batch:
+                    self.skipped += 1
+                else:
+                    batch[key] = None
+                    if len(batch) == options['batch_size']:
+                        self.import_batch(batch)
+                        batch = {}
+        if batch:
+            self.import_batch(batch)
+        if self.inserted:
+            bump_version('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {self.inserted}, уже было: {self.skipped}, '
+            f'ошибочных строк: {self.invalid}'))
+
+    def clean(self, name, measurement_unit):
+        if not (isinstance(name, str) and isinstance(measurement_unit, str)):
+            return None
+        name = name.strip()
+        measurement_unit = measurement_unit.strip()
+        if not (name and measurement_unit):
+            return None
+        if max(len(name), len(measurement_unit)) > settings.MAX_CHAR_LENGTH:
+            return None
+        return name, measurement_unit
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}).values_list(
+                'name', 'measurement_unit'))
+        new = [key for key in batch if key not in existing]
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in new),
+            ignore_conflicts=True,
+        )
+        self.inserted += len(new)
+        self.skipped += len(batch) - len(new)
@@ -0,0 +1,184 @@
+import json
+import os
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from recipes.feed import rebuild_timelines
+from recipes.models import Ingredient, IngredientsAmount, Recipe, Tag
+from recipes.search import rebuild_index
+from recipes.versions import bump_version
+
+User = get_user_model()
+IMAGE_DIR = Recipe._meta.get_field('image').upload_to
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из NDJSON, выгруженного export_recipes. '
+            'Каждая пачка сохраняется в своей транзакции, а уже '
+            'загруженные рецепты пропускаются, поэтому прерванную '
+            'загрузку можно просто запустить заново.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON с рецептами.')
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог с изображениями из export_recipes.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        created = skipped = 0
+        batch = []
+        with open(options['path'], 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    raise CommandError(f'Строка {number}: некорректный JSON')
+                if len(batch) == options['batch_size']:
+                    batch_created = self.import_batch(
+                        batch, options['images_dir'])
+                    created += batch_created
+                    skipped += len(batch) - batch_created
+                    batch = []
+                    self.stdout.write(f'Обработано строк: {number}')
+        if batch:
+            batch_created = self.import_batch(batch, options['images_dir'])
+            created += batch_created
+            skipped += len(batch) - batch_created
+        if created:
+            rebuild_index()
+            rebuild_timelines()
+            bump_version('counts', 'tags', 'ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {created}, пропущено: {skipped}. '
+            'Уменьшенные копии изображений создаст process_recipe_images.'))
+
+    @transaction.atomic
+    def import_batch(self, batch, images_dir):
+        authors = self.get_ids(
+            User, ('email',), [data['author'] for data in batch],
+            password=make_password(None))
+        tags = self.get_ids(
+            Tag, ('slug',), [tag for data in batch for tag in data['tags']])
+        ingredients = self.get_ids(
+            Ingredient, ('name', 'measurement_unit'), [
+                {'name': ingredient['name'],
+                 'measurement_unit': ingredient['measurement_unit']}
+                for data in batch for ingredient in data['ingredients']
+            ])
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={data['name'] for data in batch},
+        ).values_list('author_id', 'name', 'pub_date'))
+        recipes = []
+        new_batch = []
+        for data in batch:
+            recipe = Recipe(
+                author_id=authors[(data['author']['email'],)],
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                pub_date=parse_datetime(data['pub_date']),
+            )
+            key = (recipe.author_id, recipe.name, recipe.pub_date)
+            if key in existing:
+                continue
+            existing.add(key)
+            recipe.image = self.import_image(data['image'], images_dir)
+            recipes.append(recipe)
+            new_batch.append(data)
+        if not recipes:
+            return 0
+        self.create_recipes(recipes)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id,
+                                tag_id=tags[(tag['slug'],)])
+            for recipe, data in zip(recipes, new_batch)
+            for tag in data['tags']
+        )
+        IngredientsAmount.objects.bulk_create(
+            IngredientsAmount(
+                recipe_id=recipe.id,
+                ingredient_id=ingredients[(ingredient['name'],
+                                           ingredient['measurement_unit'])],
+                amount=ingredient['amount'],
+            )
+            for recipe, data in zip(recipes, new_batch)
+            for ingredient in data['ingredients']
+        )
+        return len(recipes)
+
+    def create_recipes(self, recipes):
+        # auto_now_add перезаписывает pub_date при вставке,
+        # поэтому исходные даты возвращаются отдельным bulk_update.
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id']
+            Recipe.objects.bulk_create(recipes)
+            ids = Recipe.objects.filter(id__gt=last_id or 0).order_by(
+                'id').values_list('id', flat=True)
+            for recipe, recipe_id in zip(recipes, ids):
+                recipe.id = recipe_id
+        for recipe, pub_date in zip(recipes, pub_dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+
+    def get_ids(self, model, fields, rows, **defaults):
+        """Находит id объектов по полям ``fields``, создавая недостающие."""
+        rows = {tuple(row[field] for field in fields): row for row in rows}
+        ids = self.find_ids(model, fields, rows)
+        missing = [
+            model(**row, **defaults)
+            for key, row in rows.items() if key not in ids
+        ]
+        if missing:
+            model.objects.bulk_create(missing)
+            ids = self.find_ids(model, fields, rows)
+        return ids
+
+    def find_ids(self, model, fields, keys):
+        found = model.objects.filter(
+            **{f'{fields[0]}__in': {key[0] for key in keys}}
+        ).values_list(*fields, 'id')
+        return {
+            tuple(values): pk
+            for *values, pk in found if tuple(values) in keys
+        }
+
+    def import_image(self, name, images_dir):
+        """Копирует изображение из ``images_dir`` в каталог рецептов.
+
+        Имя берётся из файла выгрузки, поэтому файлы вне ``images_dir``
+        не читаются, а в хранилище используется только имя файла.
+        """
+        if not name:
+            return name
+        basename = os.path.basename(name)
+        if basename in ('', os.curdir, os.pardir):
+            self.stderr.write(f'Некорректное имя изображения {name}')
+            return ''
+        stored = os.path.join(IMAGE_DIR, basename)
+        if not images_dir or default_storage.exists(stored):
+            return stored
+        root = os.path.realpath(images_dir)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root:
+            self.stderr.write(f'Изображение {name} вне каталога {images_dir}')
+            return ''
+        if not os.path.exists(path):
+            self.stderr.write(f'Нет файла изображения {name}')
+            return stored
+        with open(path, 'rb') as file:
+            return default_storage.save(stored, File(file))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии и WebP для изображений рецептов, '
+            'у которых их ещё нет.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать заново все изображения.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_webp='')
+        processed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            process_recipe_image(recipe_id)
+            processed += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано изображений: {processed}'))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientsAmount, ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает суммарные списки покупок пользователей '
+            'и сверяет их с корзинами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, не пересобирая.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        mismatches = self.get_mismatches()
+        self.stdout.write(f'Расхождений найдено: {len(mismatches)}')
+        if options['check']:
+            if mismatches:
+                raise CommandError('Списки покупок не совпадают с корзинами')
+            return
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.all().delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                (ShoppingCartIngredient(user_id=user_id,
+                                        ingredient_id=ingredient_id,
+                                        amount=amount)
+                 for (user_id, ingredient_id), amount
+                 in self.get_live_totals().items()),
+                batch_size=options['batch_size'],
+            )
+        if self.get_mismatches():
+            raise CommandError('После пересборки остались расхождения')
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+
+    def get_live_totals(self):
+        totals = IngredientsAmount.objects.filter(
+            recipe__shopping_cart__isnull=False).values(
+                'recipe__shopping_cart__user', 'ingredient').annotate(
+                    total_amount=Sum('amount')).order_by()
+        return {
+            (row['recipe__shopping_cart__user'], row['ingredient']):
+                row['total_amount']
+            for row in totals.iterator()
+        }
+
+    def get_stored_totals(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount').iterator()
+        }
+
+    def get_mismatches(self):
+        live = self.get_live_totals()
+        stored = self.get_stored_totals()
+        return {
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        }
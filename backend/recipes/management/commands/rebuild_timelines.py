@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает материализованные ленты подписок: создаёт их '
+            'пользователям с числом подписок от FEED_FANOUT_THRESHOLD, '
+            'удаляет у остальных и обрезает до FEED_TIMELINE_SIZE.')
+
+    def handle(self, *args, **options):
+        rebuilt, dropped = rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент пересобрано: {rebuilt}, удалено: {dropped} '
+            f'(порог {settings.FEED_FANOUT_THRESHOLD} подписок)'))
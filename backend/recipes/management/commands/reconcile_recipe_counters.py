@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from recipes.models import RECIPE_COUNTERS, Recipe, live_count
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и корзин у рецептов с таблицами '
+            'Favorite и ShoppingCart и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = self.get_mismatches()
+        self.stdout.write(f'Рецептов с расхождениями: {mismatches.count()}')
+        if options['check']:
+            if mismatches.exists():
+                raise CommandError('Счётчики не совпадают с таблицами')
+            return
+        Recipe.objects.filter(
+            id__in=list(mismatches.values_list('id', flat=True))).update(**{
+                field: live_count(model)
+                for model, field in RECIPE_COUNTERS.items()
+            })
+        if self.get_mismatches().exists():
+            raise CommandError('После исправления остались расхождения')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
+
+    def get_mismatches(self):
+        mismatch = Q()
+        annotations = {}
+        for model, field in RECIPE_COUNTERS.items():
+            annotations[f'live_{field}'] = live_count(model)
+            mismatch |= ~Q(**{field: F(f'live_{field}')})
+        return Recipe.objects.annotate(**annotations).filter(mismatch)
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    '''
+    ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+        ) STORED
+    ''',
+    '''
+    CREATE INDEX recipes_recipe_search_vector_idx
+        ON recipes_recipe USING GIN (search_vector)
+    ''',
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX recipes_recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+SQLITE_FORWARD = (
+    '''
+    CREATE VIRTUAL TABLE recipes_recipe_fts
+        USING fts5(name, text, tokenize='unicode61')
+    ''',
+    '''
+    INSERT INTO recipes_recipe_fts (rowid, name, text)
+        SELECT id, name, text FROM recipes_recipe
+    ''',
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE recipes_recipe_fts',
+)
+
+
+def run_statements(postgresql, sqlite):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            statements = postgresql
+        elif vendor == 'sqlite':
+            statements = sqlite
+        else:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_auto_20230921_1107'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements(POSTGRESQL_FORWARD, SQLITE_FORWARD),
+            run_statements(POSTGRESQL_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
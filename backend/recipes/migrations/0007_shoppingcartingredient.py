@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-17 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_cart_ingredients(apps, schema_editor):
+    IngredientsAmount = apps.get_model('recipes', 'IngredientsAmount')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    totals = IngredientsAmount.objects.filter(
+        recipe__shopping_cart__isnull=False).values(
+            'recipe__shopping_cart__user', 'ingredient').annotate(
+                total_amount=models.Sum('amount')).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        (ShoppingCartIngredient(
+            user_id=row['recipe__shopping_cart__user'],
+            ingredient_id=row['ingredient'],
+            amount=row['total_amount'])
+         for row in totals.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField()),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_ingredients', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_ingredients', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_cart_ingredient'),
+        ),
+        migrations.RunPython(fill_shopping_cart_ingredients,
+                             migrations.RunPython.noop),
+    ]
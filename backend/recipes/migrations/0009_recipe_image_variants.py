@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-17 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_detail',
+            field=models.ImageField(blank=True, upload_to='food/recipe'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_list',
+            field=models.ImageField(blank=True, upload_to='food/recipe'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_webp',
+            field=models.ImageField(blank=True, upload_to='food/recipe'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientsAmount = apps.get_model('recipes', 'IngredientsAmount')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit').annotate(
+            keep_id=models.Min('id'), total=models.Count('id')).filter(
+                total__gt=1).order_by()
+    for row in duplicates.iterator():
+        extra_ids = list(Ingredient.objects.filter(
+            name=row['name'],
+            measurement_unit=row['measurement_unit'],
+        ).exclude(id=row['keep_id']).values_list('id', flat=True))
+        for model, owner in ((IngredientsAmount, 'recipe_id'),
+                             (ShoppingCartIngredient, 'user_id')):
+            for item in model.objects.filter(ingredient_id__in=extra_ids):
+                merged = model.objects.filter(
+                    ingredient_id=row['keep_id'],
+                    **{owner: getattr(item, owner)},
+                ).update(amount=models.F('amount') + item.amount)
+                if merged:
+                    item.delete()
+                else:
+                    item.ingredient_id = row['keep_id']
+                    item.save()
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_merge_duplicate_ingredients'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'),
+        ),
+    ]
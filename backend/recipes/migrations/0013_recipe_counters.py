@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-17 06:29
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_recipe_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    counters = {
+        'favorites_count': apps.get_model('recipes', 'Favorite'),
+        'shopping_cart_count': apps.get_model('recipes', 'ShoppingCart'),
+    }
+    Recipe.objects.update(**{
+        field: Coalesce(models.Subquery(
+            model.objects.filter(recipe=models.OuterRef('pk')).order_by(
+            ).values('recipe').annotate(
+                count=models.Count('id')).values('count'),
+        ), 0)
+        for field, model in counters.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_recipe_counters,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+    ]
@@ -1,8 +1,21 @@
+from collections import Counter, defaultdict
+
 from colorfield.fields import ColorField
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
 
 User = get_user_model()
 
@@ -17,6 +30,9 @@ class Tag(models.Model):
     class Meta:
         ordering = ('name',)
 
+    def __str__(self):
+        return self.name
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -26,13 +42,15 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
-    constraints = [
-        models.UniqueConstraint(
-            fields=['name', 'measurement_unit'],
-            name='unique_ingredient'
-        )
-    ]
+    def __str__(self):
+        return f'{self.name}, {self.measurement_unit}'
 
 
 class Recipe(models.Model):
@@ -46,6 +64,18 @@ class Recipe(models.Model):
         upload_to='food/recipe',
         default=None,
     )
+    image_list = models.ImageField(
+        upload_to='food/recipe',
+        blank=True,
+    )
+    image_detail = models.ImageField(
+        upload_to='food/recipe',
+        blank=True,
+    )
+    image_webp = models.ImageField(
+        upload_to='food/recipe',
+        blank=True,
+    )
     text = models.TextField()
     tags = models.ManyToManyField(
         Tag,
@@ -65,9 +95,51 @@ class Recipe(models.Model):
         through='IngredientsAmount',
         related_name="recipes",
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-favorites_count', '-pub_date', '-id'],
+                         name='recipe_popular_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class IngredientsAmountQuerySet(models.QuerySet):
+    """bulk_create и bulk_update не отправляют сигналы, поэтому итоги
+    корзин для них пересчитываются здесь, одним вызовом на пачку."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        change_cart_amounts(
+            change for obj in objs for change in amount_changes(
+                None, obj.get_state()))
+        for obj in objs:
+            obj.saved_state = obj.get_state()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        saved = get_saved_states(objs)
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        change_cart_amounts(
+            change for obj in objs for change in amount_changes(
+                saved.get(obj.pk), obj.get_state()))
+        for obj in objs:
+            obj.saved_state = obj.get_state()
+        return updated
 
 
 class IngredientsAmount(models.Model):
@@ -90,6 +162,8 @@ class IngredientsAmount(models.Model):
         ]
     )
 
+    objects = IngredientsAmountQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -97,6 +171,16 @@ class IngredientsAmount(models.Model):
                 name='unique_recipe_ingredient')
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(field in instance.__dict__ for field in AMOUNT_STATE):
+            instance.saved_state = instance.get_state()
+        return instance
+
+    def get_state(self):
+        return tuple(getattr(self, field) for field in AMOUNT_STATE)
+
 
 class Favorite(models.Model):
     user = models.ForeignKey(
@@ -136,3 +220,173 @@ class ShoppingCart(models.Model):
                 fields=['user', 'recipe'],
                 name='unique_user_recipe_cart')
         ]
+
+
+class ShoppingCartIngredientQuerySet(models.QuerySet):
+
+    def add_amounts(self, user_ids, amounts):
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                id__in=user_ids).order_by('id').values_list('id'))
+            rows = self.filter(user_id__in=user_ids,
+                               ingredient_id__in=amounts)
+            existing = set(rows.values_list('user_id', 'ingredient_id'))
+            if existing:
+                rows.update(amount=F('amount') + Case(
+                    *(When(ingredient_id=ingredient_id, then=Value(amount))
+                      for ingredient_id, amount in amounts.items()),
+                    output_field=IntegerField(),
+                ))
+                rows.filter(amount__lte=0).delete()
+            self.bulk_create(
+                self.model(user_id=user_id,
+                           ingredient_id=ingredient_id,
+                           amount=amount)
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items()
+                if amount > 0 and (user_id, ingredient_id) not in existing
+            )
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+    )
+    amount = models.PositiveIntegerField()
+
+    objects = ShoppingCartIngredientQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_cart_ingredient')
+        ]
+
+
+class Timeline(models.Model):
+    """Признак того, что лента пользователя материализована."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='timeline',
+    )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_user_timeline_recipe')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+
+AMOUNT_STATE = ('recipe_id', 'ingredient_id', 'amount')
+
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+
+def live_count(model):
+    """Выражение для Recipe: число строк ``model`` у рецепта."""
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe').annotate(count=Count('id')).values('count'),
+    ), 0)
+
+
+def change_recipe_counter(model, recipe_id, delta):
+    field = RECIPE_COUNTERS[model]
+    recipes = Recipe.objects.filter(pk=recipe_id)
+    if delta < 0:
+        recipes = recipes.filter(**{f'{field}__gte': -delta})
+    recipes.update(**{field: F(field) + delta})
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(IngredientsAmount.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def get_saved_states(amounts):
+    """Сохранённые в базе (рецепт, ингредиент, количество) по pk."""
+    states = {
+        amount.pk: amount.saved_state for amount in amounts
+        if getattr(amount, 'saved_state', None) is not None
+    }
+    missing = [amount.pk for amount in amounts
+               if amount.pk is not None and amount.pk not in states]
+    if missing:
+        for pk, *state in IngredientsAmount.objects.filter(
+                pk__in=missing).values_list('pk', *AMOUNT_STATE):
+            states[pk] = tuple(state)
+    return states
+
+
+def amount_changes(old, new):
+    if old is not None:
+        yield old[0], old[1], -old[2]
+    if new is not None:
+        yield new
+
+
+def change_cart_amounts(changes):
+    """Применяет изменения ингредиентов рецептов к итогам корзин.
+
+    ``changes`` — тройки (id рецепта, id ингредиента, изменение
+    количества); итоги меняются у всех, чья корзина содержит рецепт.
+    """
+    deltas = defaultdict(Counter)
+    for recipe_id, ingredient_id, delta in changes:
+        deltas[recipe_id][ingredient_id] += delta
+    if not deltas:
+        return
+    users = defaultdict(list)
+    for recipe_id, user_id in ShoppingCart.objects.filter(
+            recipe_id__in=deltas).values_list('recipe_id', 'user_id'):
+        users[recipe_id].append(user_id)
+    for recipe_id, user_ids in users.items():
+        ShoppingCartIngredient.objects.add_amounts(
+            user_ids, deltas[recipe_id])
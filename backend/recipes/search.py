@@ -0,0 +1,92 @@
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+)
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def is_postgresql(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'postgresql'
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def fts_match_expression(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def tsquery_expression(terms):
+    """Запрос для to_tsquery: все слова по префиксу, как в FTS5."""
+    return ' & '.join(f"'{term}':*" for term in terms)
+
+
+def search_recipes(queryset, query):
+    """Рецепты, в названии или тексте которых есть все слова запроса.
+
+    Слова ищутся по префиксу на обеих базах, результаты сортируются
+    по релевантности, затем по дате публикации.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+    if is_postgresql(queryset.db):
+        vector = RawSQL('"recipes_recipe"."search_vector"', [],
+                        output_field=SearchVectorField())
+        search_query = SearchQuery(tsquery_expression(terms),
+                                   config=SEARCH_CONFIG, search_type='raw')
+        queryset = queryset.annotate(
+            search_vector=vector,
+            search_rank=SearchRank(vector, search_query),
+        ).filter(search_vector=search_query)
+    else:
+        expression = fts_match_expression(terms)
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (expression,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = "recipes_recipe"."id"',
+            (expression,),
+        ))
+    return queryset.order_by('-search_rank', '-pub_date')
+
+
+def index_recipe(recipe, using=DEFAULT_DB_ALIAS):
+    if is_postgresql(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe.id,))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            (recipe.id, recipe.name, recipe.text),
+        )
+
+
+def unindex_recipe(recipe_id, using=DEFAULT_DB_ALIAS):
+    if is_postgresql(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe_id,))
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    if is_postgresql(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'SELECT id, name, text FROM recipes_recipe')
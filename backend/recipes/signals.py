@@ -0,0 +1,144 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from users.models import Follow
+
+from .feed import fan_out_recipe, follow_added, follow_removed
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientsAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+    amount_changes,
+    change_cart_amounts,
+    change_recipe_counter,
+    get_recipe_amounts,
+    get_saved_states,
+)
+from .search import index_recipe, unindex_recipe
+from .versions import bump_version, get_user_counts_version_name
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tags_changed(**kwargs):
+    bump_version('tags', 'counts')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, using, **kwargs):
+    index_recipe(instance, using)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, using, **kwargs):
+    unindex_recipe(instance.id, using)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(instance, created, **kwargs):
+    if created:
+        ShoppingCartIngredient.objects.add_amounts(
+            [instance.user_id], get_recipe_amounts(instance.recipe_id))
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(instance, **kwargs):
+    # Количества читаются после удаления: при удалении рецепта его
+    # ингредиенты могут быть уже удалены и вычтены из итогов.
+    ShoppingCartIngredient.objects.add_amounts(
+        [instance.user_id],
+        {ingredient_id: -amount for ingredient_id, amount
+         in get_recipe_amounts(instance.recipe_id).items()},
+    )
+
+
+@receiver(pre_save, sender=IngredientsAmount)
+def recipe_ingredient_saving(instance, **kwargs):
+    instance.saved_state = None if instance.pk is None else (
+        get_saved_states([instance]).get(instance.pk))
+
+
+@receiver(post_save, sender=IngredientsAmount)
+def recipe_ingredient_saved(instance, **kwargs):
+    change_cart_amounts(amount_changes(
+        instance.saved_state, instance.get_state()))
+    instance.saved_state = instance.get_state()
+
+
+@receiver(post_delete, sender=IngredientsAmount)
+def recipe_ingredient_deleted(instance, **kwargs):
+    saved = getattr(instance, 'saved_state', None)
+    change_cart_amounts(amount_changes(saved or instance.get_state(), None))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(instance, created=True, **kwargs):
+    # Общее число рецептов меняют только создание и удаление
+    # (post_delete не передаёт created).
+    names = [f'recipe:{instance.id}']
+    if created:
+        names.append('counts')
+    bump_version(*names)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def recipe_relation_changed(instance, **kwargs):
+    bump_version(f'recipe:{instance.recipe_id}',
+                 get_user_counts_version_name(instance.user_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_relation_added(sender, instance, created, **kwargs):
+    if created:
+        change_recipe_counter(sender, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_relation_deleted(sender, instance, **kwargs):
+    change_recipe_counter(sender, instance.recipe_id, -1)
+
+
+@receiver([post_save, post_delete], sender=IngredientsAmount)
+def recipe_ingredients_changed(instance, **kwargs):
+    bump_version(f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    recipe_ids = (pk_set or ()) if reverse else [instance.id]
+    bump_version('counts', *(f'recipe:{pk}' for pk in recipe_ids))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(instance, created, **kwargs):
+    if created:
+        follow_added(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    follow_removed(instance.user_id, instance.author_id)
@@ -0,0 +1,293 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from recipes.feed import materialize_timeline
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientsAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+    TimelineEntry,
+)
+from users.models import Follow, User
+
+
+class ShoppingCartTotalsTest(TestCase):
+    """Итоги корзин совпадают с корзинами после любых записей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(4)
+        ]
+        author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='food/recipe/test.jpg')
+            for ingredient in cls.ingredients[:2]:
+                IngredientsAmount.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+            cls.recipes.append(recipe)
+        cls.users = [
+            User.objects.create(
+                username=f'user{number}', email=f'user{number}@example.com',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(2)
+        ]
+        for user in cls.users:
+            for recipe in cls.recipes:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def assert_totals(self):
+        call_command('rebuild_shopping_cart_totals', '--check',
+                     stdout=StringIO())
+
+    def first_amount(self):
+        return IngredientsAmount.objects.filter(
+            recipe=self.recipes[0]).order_by('id').first()
+
+    def test_cart_changes(self):
+        self.assert_totals()
+        ShoppingCart.objects.filter(user=self.users[0],
+                                    recipe=self.recipes[0]).delete()
+        self.assert_totals()
+
+    def test_save_amount(self):
+        amount = self.first_amount()
+        amount.amount = 25
+        amount.save()
+        self.assert_totals()
+        self.assertEqual(ShoppingCartIngredient.objects.get(
+            user=self.users[0], ingredient=amount.ingredient).amount, 35)
+
+    def test_save_ingredient(self):
+        amount = self.first_amount()
+        amount.ingredient = self.ingredients[3]
+        amount.save()
+        self.assert_totals()
+
+    def test_save_without_loading(self):
+        pk = self.first_amount().pk
+        IngredientsAmount(pk=pk, recipe=self.recipes[0],
+                          ingredient=self.ingredients[0], amount=3).save()
+        self.assert_totals()
+
+    def test_create_and_delete(self):
+        amount = IngredientsAmount.objects.create(
+            recipe=self.recipes[0], ingredient=self.ingredients[2], amount=7)
+        self.assert_totals()
+        amount.delete()
+        self.assert_totals()
+        IngredientsAmount.objects.filter(recipe=self.recipes[1]).delete()
+        self.assert_totals()
+
+    def test_bulk_create_and_update(self):
+        IngredientsAmount.objects.bulk_create(
+            IngredientsAmount(recipe=recipe, ingredient=self.ingredients[2],
+                              amount=5)
+            for recipe in self.recipes)
+        self.assert_totals()
+        amounts = list(IngredientsAmount.objects.filter(
+            ingredient=self.ingredients[0]))
+        for amount in amounts:
+            amount.amount = 1
+        IngredientsAmount.objects.bulk_update(amounts, ['amount'])
+        self.assert_totals()
+
+    def test_delete_recipe(self):
+        self.recipes[0].delete()
+        self.assert_totals()
+
+    def test_delete_ingredient(self):
+        self.ingredients[0].delete()
+        self.assert_totals()
+
+
+@override_settings(FEED_TIMELINE_SIZE=3)
+class TimelineTrimTest(TestCase):
+    """Материализованные ленты не растут дальше FEED_TIMELINE_SIZE."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(2)
+        ]
+        cls.users = [
+            User.objects.create(
+                username=f'user{number}', email=f'user{number}@example.com',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(2)
+        ]
+        for user in cls.users:
+            Follow.objects.create(user=user, author=cls.authors[0])
+            materialize_timeline(user.id)
+
+    def create_recipes(self, author, count):
+        return [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='food/recipe/test.jpg')
+            for number in range(count)
+        ]
+
+    def timeline(self, user):
+        return list(TimelineEntry.objects.filter(user=user).order_by(
+            '-pub_date', '-recipe_id').values_list('recipe_id', flat=True))
+
+    def newest(self, recipes):
+        return [recipe.id for recipe in sorted(
+            recipes, key=lambda recipe: (recipe.pub_date, recipe.id),
+            reverse=True)[:3]]
+
+    def test_fan_out(self):
+        recipes = self.create_recipes(self.authors[0], 5)
+        for user in self.users:
+            self.assertEqual(self.timeline(user), self.newest(recipes))
+
+    def test_follow_added(self):
+        recipes = self.create_recipes(self.authors[0], 2)
+        recipes += self.create_recipes(self.authors[1], 3)
+        Follow.objects.create(user=self.users[0], author=self.authors[1])
+        self.assertEqual(self.timeline(self.users[0]), self.newest(recipes))
+        self.assertEqual(self.timeline(self.users[1]),
+                         self.newest(recipes[:2]))
+
+
+class ImportRecipesTest(TestCase):
+    """import_recipes читает изображения только из --images-dir."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = self.settings(
+            MEDIA_ROOT=os.path.join(self.directory, 'media'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.images_dir = os.path.join(self.directory, 'export')
+        self.write_file(os.path.join('export', 'food', 'recipe', 'ok.jpg'))
+        self.write_file('secret.jpg')
+
+    def write_file(self, name):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'image')
+
+    def recipe_data(self, number, image):
+        return {
+            'author': {'email': 'author@example.com', 'username': 'author',
+                       'first_name': 'Имя', 'last_name': 'Фамилия'},
+            'name': f'Рецепт {number}',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'pub_date': f'2024-01-0{number + 1}T00:00:00+00:00',
+            'image': image,
+            'tags': [{'name': 'Тег', 'color': '#000000', 'slug': 'tag'}],
+            'ingredients': [{'name': 'Соль', 'measurement_unit': 'г',
+                             'amount': 5}],
+        }
+
+    def test_images(self):
+        images = {
+            'food/recipe/ok.jpg': 'food/recipe/ok.jpg',
+            '../secret.jpg': '',
+            os.path.join(self.directory, 'secret.jpg'): '',
+            'food/../../secret.jpg': '',
+        }
+        path = os.path.join(self.directory, 'recipes.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            for number, image in enumerate(images):
+                file.write(json.dumps(self.recipe_data(number, image)))
+                file.write('\n')
+        call_command('import_recipes', path, '--images-dir', self.images_dir,
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            list(Recipe.objects.order_by('pub_date').values_list(
+                'image', flat=True)),
+            list(images.values()))
+        self.assertTrue(default_storage.exists('food/recipe/ok.jpg'))
+        self.assertFalse(default_storage.exists('food/recipe/secret.jpg'))
+
+
+# Сессия, пользователь, количество и строки страницы;
+# у рецептов ещё теги для фильтра.
+ADMIN_CHANGELIST_QUERIES = {
+    'recipes/recipe': 5,
+    'recipes/ingredientsamount': 4,
+    'recipes/favorite': 4,
+    'recipes/shoppingcart': 4,
+    'users/follow': 4,
+}
+
+
+class AdminChangelistQueriesTest(TestCase):
+    """Число запросов страниц списков админки не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin',
+            first_name='Имя', last_name='Фамилия')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}',
+                               color=f'#00000{number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+        cls.users = []
+
+    def add_rows(self, count):
+        for number in range(len(self.users), len(self.users) + count):
+            user = User.objects.create(
+                username=f'user{number}', email=f'user{number}@example.com',
+                first_name='Имя', last_name='Фамилия')
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='food/recipe/test.jpg')
+            recipe.tags.set(self.tags)
+            for ingredient in self.ingredients:
+                IngredientsAmount.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+            Favorite.objects.create(user=self.admin, recipe=recipe)
+            ShoppingCart.objects.create(user=self.admin, recipe=recipe)
+            if self.users:
+                Follow.objects.create(user=user, author=self.users[0])
+            self.users.append(user)
+
+    def assert_changelists(self):
+        for changelist, queries in ADMIN_CHANGELIST_QUERIES.items():
+            with self.subTest(changelist=changelist, rows=len(self.users)):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(f'/admin/{changelist}/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_changelists(self):
+        self.client.force_login(self.admin)
+        self.add_rows(3)
+        self.assert_changelists()
+        self.add_rows(20)
+        self.assert_changelists()
@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+
+
+def get_user_counts_version_name(user_id):
+    """Версия количеств в списках, отфильтрованных по пользователю."""
+    return f'counts:user:{user_id}'
+
+
+def get_version(name):
+    return cache.get_or_set(VERSION_KEY.format(name), time.time, timeout=None)
+
+
+def find_version(name):
+    """Версия из кэша или None; отсутствующую версию не создаёт."""
+    return cache.get(VERSION_KEY.format(name))
+
+
+def add_version(name, timeout=None):
+    """Создаёт версию, если её ещё нет.
+
+    Возвращает None, если версию успели записать другие: тогда её
+    значение могло появиться из-за изменения данных, прочитанных раньше.
+    """
+    version = time.time()
+    if cache.add(VERSION_KEY.format(name), version, timeout=timeout):
+        return version
+    return None
+
+
+def get_versions(*names):
+    keys = [VERSION_KEY.format(name) for name in names]
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else get_version(name)
+        for key, name in zip(keys, names)
+    ]
+
+
+def bump_version(*names, timeout=None):
+    transaction.on_commit(lambda: cache.set_many(
+        {VERSION_KEY.format(name): time.time() for name in names},
+        timeout=timeout,
+    ))
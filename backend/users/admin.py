@@ -10,9 +10,13 @@ class UserAdmin(UserAdmin):
                     'first_name',
                     'last_name', 'email',
                     'is_staff')
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    show_full_result_count = False
 
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import bump_token_versions
+from recipes.versions import bump_version, get_user_counts_version_name
+
+from .models import Follow, User
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(instance, created=True, **kwargs):
+    # Число пользователей меняют только создание и удаление
+    # (post_delete не передаёт created).
+    names = [f'user:{instance.id}']
+    if created:
+        names.append('users')
+    bump_version(*names)
+    bump_token_versions(*Token.objects.filter(
+        user_id=instance.id).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    bump_token_versions(instance.key)
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def follows_changed(instance, **kwargs):
+    bump_version(f'user:{instance.author_id}',
+                 get_user_counts_version_name(instance.user_id))